@@ -1,9 +1,11 @@
 import argparse
+from itertools import combinations
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.')
+    parser.add_argument('--target', '-t', help='Sum the entries must add up to.', type=int, default=2020)
 
     return parser.parse_args()
 
@@ -25,26 +27,91 @@ def get_inputs(input_file):
     return inputs
 
 
-def get_entries_of_sum(inputs, num_entries, sum, entries=[]):
-    """Recursive function to return a list of entries of a sum given by the parameter"""
-    if num_entries == 1:
-        if sum in inputs:
-            entries.append(sum)
-            return entries
-        return None
-    
-    for input in inputs:
-        diff = sum - input
-        new_inputs = inputs.copy()
-        new_inputs.remove(input)
-        entries = get_entries_of_sum(new_inputs, num_entries-1, diff, entries)
-        if entries is not None:
-            entries.append(input)
-            return entries
-        else:
-            entries = []
-
-    return None
+def _two_sum(values, target, find_all):
+    """Hash-set 2-sum over a sorted list of values"""
+    matches = []
+    seen = set()
+
+    for value in values:
+        diff = target - value
+        if diff in seen:
+            matches.append((diff, value))
+            if not find_all:
+                break
+        seen.add(value)
+
+    return list(dict.fromkeys(matches))
+
+
+def _three_sum(values, target, find_all):
+    """Sorted two-pointer 3-sum, skipping duplicate values on each pointer"""
+    matches = []
+
+    for first in range(len(values) - 2):
+        if first > 0 and values[first] == values[first - 1]:
+            continue
+        low, high = first + 1, len(values) - 1
+        while low < high:
+            total = values[first] + values[low] + values[high]
+            if total < target:
+                low += 1
+            elif total > target:
+                high -= 1
+            else:
+                matches.append((values[first], values[low], values[high]))
+                if not find_all:
+                    return matches
+                low += 1
+                while low < high and values[low] == values[low - 1]:
+                    low += 1
+                high -= 1
+
+    return matches
+
+
+def _k_sum(values, num_entries, target, find_all):
+    """Meet-in-the-middle k-sum: index sums of the lower half, probe with the upper half"""
+    left_size = num_entries // 2
+    right_size = num_entries - left_size
+
+    # Every index set is only counted once by requiring all of its left indices
+    # to come before all of its right indices
+    left_sums = {}
+    for combo in combinations(range(len(values)), left_size):
+        total = sum(values[i] for i in combo)
+        left_sums.setdefault(total, []).append(combo)
+
+    matches = {}
+    for combo in combinations(range(len(values)), right_size):
+        diff = target - sum(values[i] for i in combo)
+        for left_combo in left_sums.get(diff, ()):
+            if left_combo[-1] < combo[0]:
+                entries = tuple(values[i] for i in left_combo + combo)
+                matches[entries] = None
+                if not find_all:
+                    return list(matches)
+
+    return list(matches)
+
+
+def get_entries_of_sum(inputs, num_entries, target=2020, find_all=False):
+    """Return the first tuple of entries adding up to target, or every such tuple if find_all is set"""
+    values = sorted(inputs)
+
+    if num_entries < 1 or num_entries > len(values):
+        matches = []
+    elif num_entries == 1:
+        matches = [(target,)] if target in values else []
+    elif num_entries == 2:
+        matches = _two_sum(values, target, find_all)
+    elif num_entries == 3:
+        matches = _three_sum(values, target, find_all)
+    else:
+        matches = _k_sum(values, num_entries, target, find_all)
+
+    if find_all:
+        return matches
+    return matches[0] if matches else None
 
 def get_product_of_entries(entries):
     """Simple operation to find the product of a list"""
@@ -65,14 +132,14 @@ def main():
     ####################
     #      Part 1      #
     ####################
-    entries = get_entries_of_sum(inputs, 2, 2020)
+    entries = get_entries_of_sum(inputs, 2, args.target)
     product = get_product_of_entries(entries)
     print("[Part 1]\nEntries: {}\nProduct: {}\n".format(entries, product))
 
     ####################
     #      Part 2      #
     ####################
-    entries = get_entries_of_sum(inputs, 3, 2020)
+    entries = get_entries_of_sum(inputs, 3, args.target)
     product = get_product_of_entries(entries)
     print("[Part 2]\nEntries: {}\nProduct: {}".format(entries, product))
 
@@ -1,10 +1,14 @@
 import argparse
-import copy
+import numpy as np
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only re-evaluate seats whose neighborhood changed.')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Print the seats evaluated and flipped each generation.')
 
     return parser.parse_args()
 
@@ -30,84 +34,245 @@ def get_inputs(input_file):
     return inputs
 
 
-def _within_bounds(row_min, row_max, col_min, col_max, row, col):
-    if row >= row_min and row < row_max and col >= col_min and col < col_max:
-        return True
-    return False 
-
-
-def get_neighbors(seat_map, row, col, single_depth=False):
-    """Get the neighboring seat in each direction from the current seat"""
-    neighbors = []
-    direction_ops = {'top_left': (-1, -1), 'top': (-1, 0), 'top_right': (-1, 1),
-                     'bot_left': (1, -1), 'bot': (1, 0), 'bot_right': (1, 1),
-                     'left': (0, -1), 'right': (0, 1)}
-
-    row_min = col_min = 0
-    row_max = len(seat_map)
-    col_max = len(seat_map[0])
-
-    for _, ops in direction_ops.items():
-        i = row + ops[0]
-        j = col + ops[1]
-        while _within_bounds(row_min, row_max, col_min, col_max, i, j):
-            if seat_map[i][j] != '.':
-                neighbors.append(seat_map[i][j])
-                break
-            i += ops[0]
-            j += ops[1]
-            if single_depth:
-                break
-
-    return neighbors
-    
-
-def activate_seat_rule(seat_map, part=1):
-    """Applies an iteration of the rules"""
-    seat_map_copy = copy.deepcopy(seat_map)
-    seat_change = False
-    crowd_limit = 4 if part == 1 else 5
-    single_depth = True if part == 1 else False
-
-    for row in range(len(seat_map)):
-        for col in range(len(seat_map[row])):
-            neighbor_seats = get_neighbors(seat_map_copy, row, col, single_depth=single_depth)
-            if seat_map_copy[row][col] == 'L' and neighbor_seats.count('#') == 0:
-                seat_map[row][col] = '#'
-                seat_change = True
-            elif seat_map_copy[row][col] == '#' and neighbor_seats.count('#') >= crowd_limit:
-                seat_map[row][col] = 'L'
-                seat_change = True
-
-    return seat_change
-
-
-def count_occupied_seats(seat_map):
-    """Returns the number of occupied seats in the map"""
-    num_occupied = 0
-
-    for row in range(len(seat_map)):
-        num_occupied += seat_map[row].count('#')
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1),
+              (0, -1),           (0, 1),
+              (1, -1),  (1, 0),  (1, 1)]
+
+
+def _to_arrays(seat_map):
+    """Returns uint8 arrays marking the seat cells and the occupied cells of the map"""
+    grid = np.array(seat_map, dtype='U1').reshape(len(seat_map), -1)
+    seats = (grid != '.').astype(np.uint8)
+    occupied = (grid == '#').astype(np.uint8)
+
+    return seats, occupied
+
+
+def _shift_slices(offset, size):
+    """Returns the (source, destination) slices pairing each index with the one offset from it"""
+    source = slice(max(offset, 0), size + min(offset, 0))
+    destination = slice(max(-offset, 0), size + min(-offset, 0))
+
+    return source, destination
+
+
+def adjacent_seats(seats):
+    """Neighbor rule yielding, per direction, the flat index of the adjacent cell or -1 off the map"""
+    rows, cols = seats.shape
+    flat_index = np.arange(rows * cols).reshape(rows, cols)
+
+    for dr, dc in DIRECTIONS:
+        row_src, row_dst = _shift_slices(dr, rows)
+        col_src, col_dst = _shift_slices(dc, cols)
+        neighbors = np.full((rows, cols), -1)
+        neighbors[row_dst, col_dst] = flat_index[row_src, col_src]
+        yield neighbors.ravel()
+
+
+def visible_seats(seats):
+    """Neighbor rule yielding, per direction, the flat index of the first visible seat or -1"""
+    rows, cols = seats.shape
+    flat_index = np.arange(rows * cols).reshape(rows, cols)
+
+    for dr, dc in DIRECTIONS:
+        nearest = np.full((rows, cols), -1)
+        # Sweep against the direction of travel so the cell one step away is already resolved
+        if dr != 0:
+            col_src, col_dst = _shift_slices(dc, cols)
+            order = range(rows) if dr < 0 else range(rows - 1, -1, -1)
+            for row in order:
+                if not 0 <= row + dr < rows:
+                    continue
+                step = row + dr, col_src
+                nearest[row, col_dst] = np.where(seats[step], flat_index[step], nearest[step])
+        else:
+            order = range(cols) if dc < 0 else range(cols - 1, -1, -1)
+            for col in order:
+                if not 0 <= col + dc < cols:
+                    continue
+                step = slice(None), col + dc
+                nearest[:, col] = np.where(seats[step], flat_index[step], nearest[step])
+        yield nearest.ravel()
+
+
+def _pad_rows(indptr, indices):
+    """Lays CSR rows out as (max_degree, num_rows) slots padded with the sentinel row num_rows"""
+    num_rows = len(indptr) - 1
+    degree = np.diff(indptr)
+    max_degree = int(degree.max()) if num_rows else 0
+    row = np.repeat(np.arange(num_rows), degree)
+    slots = np.full((max_degree, num_rows), num_rows, dtype=np.intp)
+    slots[np.arange(len(indices)) - indptr[row], row] = indices
+
+    return slots
+
+
+class SeatGraph:
+    """Compressed sparse row adjacency between the seats of a map
+
+    A neighbor rule is any callable taking the seat mask and yielding arrays of flat cell
+    indices (-1 for none), one neighbor per seat per array. Neighbors that are not seats
+    are dropped, so the simulation never has to look at the grid again.
+    """
+    def __init__(self, seats, rule):
+        self.shape = seats.shape
+        self.seat_index = np.flatnonzero(seats).astype(np.int32)
+        num_seats = len(self.seat_index)
+
+        seat_id = np.full(seats.size, -1, dtype=np.int32)
+        seat_id[self.seat_index] = np.arange(num_seats, dtype=np.int32)
+
+        # Seeded with an empty column so a rule yielding nothing still stacks
+        columns = [np.full(num_seats, -1, dtype=np.int32)]
+        for neighbors in rule(seats):
+            neighbors = np.asarray(neighbors)[self.seat_index]
+            columns.append(np.where(neighbors >= 0, seat_id[neighbors], -1))
+        table = np.stack(columns, axis=1)
+        valid = table >= 0
+
+        self.indices = table[valid].astype(np.int32)
+        self.indptr = np.zeros(num_seats + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=self.indptr[1:])
+
+        # Gathering is fastest one neighbor slot at a time, so the rows are also laid out
+        # as slots padded with a sentinel seat that is never occupied
+        self._slots = _pad_rows(self.indptr, self.indices)
+        self._count_dtype = np.uint8 if len(self._slots) < 256 else np.uint32
+        self._dependents = None
+        self._dependent_slots = None
+
+    def __len__(self):
+        return len(self.seat_index)
+
+    def count_neighbors(self, state):
+        """Returns the number of occupied neighbors of every seat given a per-seat state
+
+        The state carries one trailing, always empty entry for the sentinel seat.
+        """
+        counts = np.zeros(len(self), dtype=self._count_dtype)
+        for slot in self._slots:
+            counts += state[slot]
+
+        return counts
+
+    def dependents(self):
+        """Returns the transposed (indptr, indices) adjacency: the seats that see each seat"""
+        if self._dependents is None:
+            counts = np.bincount(self.indices, minlength=len(self))
+            indptr = np.zeros(len(self) + 1, dtype=np.int32)
+            np.cumsum(counts, out=indptr[1:])
+            row = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.indptr))
+            indices = row[np.argsort(self.indices, kind='stable')]
+            self._dependents = indptr, indices
+
+        return self._dependents
+
+    def _next_dirty(self, flipped):
+        """Returns the sorted seats whose neighborhood contains a flipped seat"""
+        if self._dependent_slots is None:
+            self._dependent_slots = _pad_rows(*self.dependents())
+        dirty = np.zeros(len(self) + 1, dtype=bool)
+        for slot in self._dependent_slots:
+            dirty[slot[flipped]] = True
+
+        return np.flatnonzero(dirty[:-1])
+
+    def run(self, state, crowd_limit, history=None):
+        """Runs the seating rules from a per-seat state to a fixed point and returns the final state
+
+        If history is a list, a (seats evaluated, seats flipped) pair is appended for every
+        generation. Arbitrary layouts can flip between two states forever, which raises a
+        ValueError.
+        """
+        current = np.zeros(len(self) + 1, dtype=np.uint8)
+        current[:-1] = state
+        previous = None
+
+        while True:
+            counts = self.count_neighbors(current)
+            new_state = current.copy()
+            new_state[:-1][counts == 0] = 1
+            new_state[:-1][counts >= crowd_limit] = 0
+            if history is not None:
+                history.append((len(self), int(np.count_nonzero(new_state != current))))
+            if np.array_equal(new_state, current):
+                return current[:-1]
+            if previous is not None and np.array_equal(new_state, previous):
+                raise ValueError('Seating layout oscillates and never settles')
+            previous, current = current, new_state
+
+    def run_incremental(self, state, crowd_limit, history=None):
+        """Same as run, but only re-evaluates seats whose neighborhood changed last generation
+
+        A seat that just flipped cannot flip back unless one of its neighbors changes, so
+        the seats seeing a flipped seat are the only ones that need another look. It only
+        beats run once flips have thinned out, as while they are widespread every seat is
+        evaluated anyway.
+        """
+        current = np.zeros(len(self) + 1, dtype=np.uint8)
+        current[:-1] = state
+        dirty = np.arange(len(self))
+        last_flipped = None
+
+        while len(dirty):
+            # Gathering through the dirty subset only pays off once it has thinned out
+            if len(dirty) > len(self) // 4:
+                counts = self.count_neighbors(current)[dirty]
+                evaluated = len(self)
+            else:
+                evaluated = len(dirty)
+                counts = np.zeros(len(dirty), dtype=self._count_dtype)
+                for slot in self._slots:
+                    counts += current[slot[dirty]]
+            occupied = current[dirty]
+            sit = (counts == 0) & (occupied == 0)
+            leave = (counts >= crowd_limit) & (occupied == 1)
+            flipped = dirty[sit | leave]
+            if history is not None:
+                history.append((evaluated, len(flipped)))
+            # Flips toggle state, so repeating last generation's flips means a two-state cycle
+            if last_flipped is not None and np.array_equal(flipped, last_flipped) and len(flipped):
+                raise ValueError('Seating layout oscillates and never settles')
+            current[dirty[sit]] = 1
+            current[dirty[leave]] = 0
+            # Marking neighborhoods costs more than it saves while flips are widespread
+            if len(flipped) > len(self) // 8:
+                dirty = np.arange(len(self))
+            else:
+                dirty = self._next_dirty(flipped)
+            last_flipped = flipped
+
+        return current[:-1]
+
+
+def simulate_seats(seat_map, rule, crowd_limit, incremental=False, history=None):
+    """Runs the seating rules under a neighbor rule and returns the final occupied array"""
+    seats, occupied = _to_arrays(seat_map)
+    graph = SeatGraph(seats, rule)
+
+    run = graph.run_incremental if incremental else graph.run
+    state = run(occupied.ravel()[graph.seat_index], crowd_limit, history=history)
+    final = np.zeros(seats.size, dtype=np.uint8)
+    final[graph.seat_index] = state
+
+    return final.reshape(graph.shape)
+
+
+def get_final_num_occupied_seats(seat_map, part=1, incremental=False, history=None):
+    """Returns the final number of occupied seats after people calm the F down"""
+    if part == 1:
+        rule, crowd_limit = adjacent_seats, 4
+    else:
+        rule, crowd_limit = visible_seats, 5
+    occupied = simulate_seats(seat_map, rule, crowd_limit, incremental=incremental, history=history)
+    num_occupied = int(occupied.sum())
 
     return num_occupied
 
 
-def get_final_num_occupied_seats(seat_map, part=1):
-    """Returns the final number of occupied seats after people calm the F down"""
-    seat_map_copy = copy.deepcopy(seat_map)
-    seat_change = True
-
-    i = 1
-    while seat_change:
-        if part == 1:
-            seat_change = activate_seat_rule(seat_map_copy, part=part)
-        elif part == 2:
-            seat_change = activate_seat_rule(seat_map_copy, part=part)
-        i += 1
-
-    num_occupied = count_occupied_seats(seat_map_copy)
-    
-    return num_occupied
+def _print_history(history):
+    for generation, (evaluated, flipped) in enumerate(history, start=1):
+        print("  Generation {}: evaluated {}, flipped {}".format(generation, evaluated, flipped))
 
 
 def main():
@@ -119,13 +284,21 @@ def main():
     ####################
     #      Part 1      #
     ####################
-    num_occupied_seats = get_final_num_occupied_seats(seat_map, part=1)
+    history = []
+    num_occupied_seats = get_final_num_occupied_seats(seat_map, part=1, incremental=args.incremental,
+                                                      history=history)
+    if args.verbose:
+        _print_history(history)
     print("[Part 1]\nNumber of Occupied Seats: {}\n".format(num_occupied_seats))
 
     ####################
     #      Part 2      #
     ####################
-    num_occupied_seats = get_final_num_occupied_seats(seat_map, part=2)
+    history = []
+    num_occupied_seats = get_final_num_occupied_seats(seat_map, part=2, incremental=args.incremental,
+                                                      history=history)
+    if args.verbose:
+        _print_history(history)
     print("[Part 2]\nNumber of Occupied Seats: {}".format(num_occupied_seats))
 
 
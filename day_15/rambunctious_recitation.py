@@ -1,10 +1,23 @@
-from collections import deque
+from array import array
 import argparse
+import os
+import struct
+
+def _positive_int(value):
+    """Parses a command line integer of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive integer'.format(value))
+    return number
+
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--checkpoint_file', '-c', help='Path to save the game to and resume it from.')
+    parser.add_argument('--checkpoint_every', help='Number of turns between checkpoints.',
+                        type=_positive_int, default=5000000)
 
     return parser.parse_args()
 
@@ -25,38 +38,146 @@ def get_inputs(input_file):
     return inputs
 
 
-def update_number_memory(number_memory, num, index):
-    """Helper function to update the memory of the last 2 occurrences of a number"""
-    num = str(num)
-    if num not in number_memory:
-        number_memory[num] = deque([index])
-    else:
-        number_memory[num].appendleft(index)
-        if len(number_memory[num]) > 2:
-            number_memory[num].pop()
-
-
-def find_nth_number(starting_numbers, nth_iteration):
-    """Finds the nth number of the sequence"""
-    number_memory = {}
-    number_sequence = starting_numbers
-
-    # not a very good runtime...
-    for index, num in enumerate(starting_numbers):
-        update_number_memory(number_memory, num, index)
-    prev_num = str(number_sequence[-1])
-    for i in range(len(starting_numbers), nth_iteration):
-        if prev_num in number_memory and len(number_memory[prev_num]) == 2:
-            new_num = number_memory[prev_num][0] - number_memory[prev_num][1]
-            number_sequence.append(new_num)
-            update_number_memory(number_memory, new_num, i)
-            prev_num = str(new_num)
+def _speak_numbers(last_seen, num, start_turn, end_turn):
+    """Plays turns start_turn + 1 through end_turn in place and returns the last number spoken
+
+    num is the number spoken on start_turn, which is not yet recorded in last_seen.
+    Turns are 1-based and a last_seen entry of 0 means the number was never spoken.
+    """
+    for turn in range(start_turn, end_turn):
+        seen = last_seen[num]
+        last_seen[num] = turn
+        num = turn - seen if seen else 0
+
+    return num
+
+
+try:
+    from numba import njit
+    import numpy as np
+    _speak_numbers_compiled = njit(cache=True)(_speak_numbers)
+except ImportError:
+    _speak_numbers_compiled = None
+
+
+CHECKPOINT_MAGIC = b'RR15'
+CHECKPOINT_HEADER = struct.Struct('<4sqqqq')
+
+
+class Recitation:
+    """A game in progress: the last-seen table, the current turn and the number spoken on it
+
+    Only the turn each number was last spoken is kept, in a flat int32 table of about
+    4 bytes per turn played. The compiled backend is used when numba is installed,
+    unless compiled is set to False.
+    """
+    def __init__(self, starting_numbers, capacity=0, compiled=None):
+        if compiled is None:
+            compiled = _speak_numbers_compiled is not None
+        if compiled and _speak_numbers_compiled is None:
+            raise ImportError('The compiled backend requires numba')
+        self.compiled = compiled
+        self.starting_numbers = list(starting_numbers)
+        self.turn = len(self.starting_numbers)
+        self.num = self.starting_numbers[-1]
+
+        # Every number spoken after the starting ones is a gap between turns, so below the turn
+        self.last_seen = array('i', [0]) * max(capacity, max(self.starting_numbers) + 1)
+        for turn, num in enumerate(self.starting_numbers[:-1], start=1):
+            self.last_seen[num] = turn
+
+    def _reserve(self, to_turn):
+        if to_turn >= 2**31:
+            raise OverflowError('Turns past 2**31 do not fit the int32 last-seen table')
+        if len(self.last_seen) < to_turn:
+            self.last_seen.extend(array('i', [0]) * (to_turn - len(self.last_seen)))
+
+    def advance(self, to_turn, checkpoint_file=None, checkpoint_every=None):
+        """Plays up to to_turn and returns the number spoken on it
+
+        With a checkpoint file, the game is saved every checkpoint_every turns and at the end.
+        """
+        if checkpoint_every is not None and checkpoint_every < 1:
+            raise ValueError('checkpoint_every must be at least 1, got {}'.format(checkpoint_every))
+        if to_turn <= len(self.starting_numbers):
+            return self.starting_numbers[to_turn - 1]
+        if to_turn < self.turn:
+            raise ValueError('Turn {} was already played, the game is at turn {}'.format(to_turn, self.turn))
+        self._reserve(to_turn)
+
+        chunk = checkpoint_every if checkpoint_file and checkpoint_every else to_turn - self.turn
+        while self.turn < to_turn:
+            end_turn = min(self.turn + chunk, to_turn)
+            if self.compiled:
+                last_seen = np.frombuffer(self.last_seen, dtype=np.int32)
+                self.num = int(_speak_numbers_compiled(last_seen, self.num, self.turn, end_turn))
+                # The buffer export has to be released before the table can grow again
+                del last_seen
+            else:
+                self.num = _speak_numbers(self.last_seen, self.num, self.turn, end_turn)
+            self.turn = end_turn
+            if checkpoint_file:
+                self.save(checkpoint_file)
+
+        return self.num
+
+    def turns(self):
+        """Lazily yields (turn, number) from the current turn on, playing the game as it goes
+
+        A fresh game starts with the starting numbers.
+        """
+        if self.turn == len(self.starting_numbers):
+            yield from enumerate(self.starting_numbers, start=1)
         else:
-            number_sequence.append(0)
-            update_number_memory(number_memory, 0, i)
-            prev_num = str(0)
-
-    return number_sequence[-1]
+            yield self.turn, self.num
+
+        while True:
+            seen = self.last_seen[self.num] if self.num < len(self.last_seen) else 0
+            self._reserve(self.turn + 1)
+            self.last_seen[self.num] = self.turn
+            self.num = self.turn - seen if seen else 0
+            self.turn += 1
+            yield self.turn, self.num
+
+    def save(self, checkpoint_file):
+        """Writes the game to a compact binary checkpoint, replacing the file atomically"""
+        tmp_file = '{}.tmp'.format(checkpoint_file)
+        with open(tmp_file, 'wb') as outfile:
+            outfile.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, self.turn, self.num,
+                                                 len(self.starting_numbers), len(self.last_seen)))
+            array('q', self.starting_numbers).tofile(outfile)
+            self.last_seen.tofile(outfile)
+        os.replace(tmp_file, checkpoint_file)
+
+    @classmethod
+    def load(cls, checkpoint_file, compiled=None):
+        """Resumes a game from a checkpoint written by save"""
+        with open(checkpoint_file, 'rb') as infile:
+            magic, turn, num, num_starting, table_size = CHECKPOINT_HEADER.unpack(
+                infile.read(CHECKPOINT_HEADER.size))
+            if magic != CHECKPOINT_MAGIC:
+                raise ValueError('{} is not a recitation checkpoint'.format(checkpoint_file))
+            starting_numbers = array('q')
+            starting_numbers.fromfile(infile, num_starting)
+            game = cls(starting_numbers, compiled=compiled)
+            game.last_seen = array('i')
+            game.last_seen.fromfile(infile, table_size)
+        game.turn = turn
+        game.num = num
+
+        return game
+
+
+def find_nth_numbers(starting_numbers, nth_iterations, compiled=None):
+    """Finds several numbers of the sequence in one game, returned as a dict keyed by turn"""
+    game = Recitation(starting_numbers, capacity=max(nth_iterations), compiled=compiled)
+
+    return {nth: game.advance(nth) for nth in sorted(nth_iterations)}
+
+
+def find_nth_number(starting_numbers, nth_iteration, compiled=None):
+    """Finds the nth number of the sequence"""
+    return find_nth_numbers(starting_numbers, [nth_iteration], compiled=compiled)[nth_iteration]
 
 
 def main():
@@ -65,18 +186,34 @@ def main():
     
     starting_numbers = get_inputs(args.input_file)
 
+    # Both parts are answered by the same game, resumed from a checkpoint if there is one
+    if args.checkpoint_file and os.path.exists(args.checkpoint_file):
+        game = Recitation.load(args.checkpoint_file)
+        if list(game.starting_numbers) != starting_numbers:
+            raise SystemExit('{} holds a game starting from {}, not {}'.format(
+                args.checkpoint_file, ','.join(map(str, game.starting_numbers)), ','.join(map(str, starting_numbers))))
+    else:
+        game = Recitation(starting_numbers, capacity=30000000)
+
     ####################
     #      Part 1      #
     ####################
-    nth_number = find_nth_number(starting_numbers, 2020)
+    if game.turn <= 2020:
+        nth_number = game.advance(2020)
+    else:
+        nth_number = find_nth_number(game.starting_numbers, 2020)
     print("[Part 1]\n2020th Number: {}\n".format(nth_number))
 
     ####################
     #      Part 2      #
     ####################
-    nth_number = find_nth_number(starting_numbers, 30000000)
-    print("[Part 1]\n30000000th Number: {}\n".format(nth_number))
+    if game.turn <= 30000000:
+        nth_number = game.advance(30000000, checkpoint_file=args.checkpoint_file,
+                                  checkpoint_every=args.checkpoint_every)
+    else:
+        nth_number = find_nth_number(game.starting_numbers, 30000000)
+    print("[Part 2]\n30000000th Number: {}\n".format(nth_number))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,3 +1,5 @@
+from collections import Counter
+from itertools import product
 import argparse
 import numpy as np
 import sys
@@ -9,107 +11,204 @@ def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--cycles', '-c', help='Number of boot cycles.', type=int, default=CYCLES_TO_BOOT)
+    parser.add_argument('--mode', '-m', help='Boot simulation mode.', choices=['sparse', 'folded', 'dense'],
+                        default='sparse')
 
     return parser.parse_args()
 
 
-def _normalize_inputs(inputs, ndim):
-    x_len = len(inputs[0]) + CYCLES_TO_BOOT * 2
-    y_len = len(inputs) + CYCLES_TO_BOOT * 2
-    z_len = CYCLES_TO_BOOT * 2 + 1
-    w_len = CYCLES_TO_BOOT * 2 + 1 if ndim == 4 else 1
+def _normalize_inputs(inputs):
+    """Returns the (x, y) coordinates of the active cubes in the initial slice"""
+    active = set()
 
-    origin = (w_len//2, z_len//2, y_len//2, x_len//2)
-    cube_state = np.full((w_len, z_len, y_len, x_len), '.')
-    
-    x_start = origin[3] - len(inputs[0]) // 2
-    x_end = origin[3] + (len(inputs[0]) + 1) // 2
-    y_start = origin[2] - len(inputs) // 2
-
-    for index, line in enumerate(inputs):
-        cube_state[origin[0]][origin[1]][y_start+index][x_start:x_end] = list(line)
+    for y, line in enumerate(inputs):
+        for x, cube in enumerate(line):
+            if cube == '#':
+                active.add((x, y))
 
-    return cube_state
+    return active
 
 
-def get_inputs(input_file, ndim=3):
+def get_inputs(input_file):
     """Return a list of inputs delimited by newlines"""
     inputs = []
 
     with open(input_file, 'r') as infile:
         inputs = [line.strip() for line in infile]
 
-    inputs = _normalize_inputs(inputs, ndim)
+    inputs = _normalize_inputs(inputs)
 
     return inputs
 
 
-def _within_bounds(w_min, w_max, z_min, z_max, y_min, y_max, x_min, x_max, w, z, y, x):
-
-    if w >= w_min and w < w_max and z >= z_min and z < z_max and y >= y_min and y < y_max and x >= x_min and x < x_max:
-        return True
-    return False 
-
-
-def get_active_neighbors(cube_state, coords):
-    """Returns the number of active neighbors from a given coordinate"""
-    w_max = len(cube_state)
-    z_max = len(cube_state[0])
-    y_max = len(cube_state[0][0])
-    x_max = len(cube_state[0][0][0])
-    num_active_neighbors = 0
-
-    for i in [-1, 0, 1]:
-        for j in [-1, 0, 1]:
-            for k in [-1, 0, 1]:
-                for l in [-1, 0, 1]:
-                    w = coords[0] + i
-                    z = coords[1] + j
-                    y = coords[2] + k
-                    x = coords[3] + l
-                    if _within_bounds(0, w_max, 0, z_max, 0, y_max, 0, x_max, w, z, y, x) and not (i == 0 and j == 0 and k == 0 and l == 0):
-                        num_active_neighbors = num_active_neighbors+1 if cube_state[w,z,y,x] == '#' else num_active_neighbors
-
-    return num_active_neighbors
-
-
-def get_active_count_after_boot(cube_state):
-    """Simulates the boot cycle and returns the number of active cubes"""
-    new_states = []
-    w_size = len(cube_state)
-    z_size = len(cube_state[0])
-    y_size = len(cube_state[0][0])
-    x_size = len(cube_state[0][0][0])
-    num_active = 0
-
-    for i in range(CYCLES_TO_BOOT):
-        # Terrible runtime... probably a more efficient way to set up/reset structure and to
-        # decide new state based on the active/inactive state of already calculated neighbors.
-        # Just learned how to use numpy so I don't want to spend anymore time lol.
-        for w in range(w_size):
-            for z in range(z_size):
-                for y in range(y_size):
-                    for x in range(x_size):
-                        num_active_neighbors = get_active_neighbors(cube_state, (w, z, y, x))
-                        if cube_state[w, z, y, x] == '#':
-                            if num_active_neighbors == 2 or num_active_neighbors == 3:
-                                new_states.append('#')
-                            else:
-                                new_states.append('.')
-                        else:
-                            if num_active_neighbors == 3:
-                                new_states.append('#')
-                            else:
-                                new_states.append('.')
-
-        cube_state = np.array(new_states)
-        cube_state = cube_state.reshape((w_size, z_size, y_size, x_size))
-
-        if i == CYCLES_TO_BOOT - 1:
-            num_active = new_states.count('#')
-        new_states = []
-
-    return num_active
+def get_neighbor_offsets(ndim):
+    """Returns every offset to a neighboring cube in ndim dimensions"""
+    return [offset for offset in product((-1, 0, 1), repeat=ndim) if any(offset)]
+
+
+def _pack(coords, base, bias):
+    """Packs coordinates into a single int key, one base-sized digit per axis"""
+    key = 0
+    for coord in reversed(coords):
+        key = key * base + coord + bias
+
+    return key
+
+
+def boot_cycle(active, deltas):
+    """Returns the active cubes after one cycle, counting neighbors only around active cubes"""
+    neighbor_counts = Counter(cube + delta for cube in active for delta in deltas)
+
+    return {cube for cube, count in neighbor_counts.items()
+            if count == 3 or (count == 2 and cube in active)}
+
+
+def _extra_axes_pattern(cube, base, bias, ndim):
+    """Returns each extra axis coordinate of a packed cube, clipped to 2"""
+    pattern = []
+    cube //= base * base
+    for _ in range(ndim - 2):
+        pattern.append(min(cube % base - bias, 2))
+        cube //= base
+
+    return tuple(pattern)
+
+
+def _folded_deltas(pattern, offsets, base):
+    """Returns the deltas from a cube with the given extra axes pattern into the folded half-space
+
+    A neighbor across a mirror plane is skipped, since its reflection is counted from the
+    other side. A cube one step off a mirror plane is next to the cube on the plane twice,
+    once directly and once through its reflection, so that delta is listed twice per axis.
+    """
+    deltas = []
+
+    for offset in offsets:
+        extra = offset[2:]
+        if any(coord == 0 and step == -1 for coord, step in zip(pattern, extra)):
+            continue
+        multiplicity = 2 ** sum(coord == 1 and step == -1 for coord, step in zip(pattern, extra))
+        deltas.extend([_pack(offset, base, 0)] * multiplicity)
+
+    return deltas
+
+
+def folded_boot_cycle(active, offsets, base, bias, ndim, delta_cache):
+    """Same as boot_cycle, for active cubes stored only in the non-negative half of the extra axes"""
+    neighbor_counts = Counter()
+
+    for cube in active:
+        pattern = _extra_axes_pattern(cube, base, bias, ndim)
+        if pattern not in delta_cache:
+            delta_cache[pattern] = _folded_deltas(pattern, offsets, base)
+        neighbor_counts.update(cube + delta for delta in delta_cache[pattern])
+
+    return {cube for cube, count in neighbor_counts.items()
+            if count == 3 or (count == 2 and cube in active)}
+
+
+def _box_sum(cells):
+    """Sums every 3x...x3 box of cells with one shifted add per axis, shrinking each axis by 2"""
+    total = cells.astype(np.uint8 if 3 ** cells.ndim < 256 else np.uint16)
+
+    for axis in range(total.ndim):
+        shifted = [[slice(None)] * total.ndim for _ in range(3)]
+        for shift in range(3):
+            shifted[shift][axis] = slice(shift, total.shape[axis] - 2 + shift)
+        total = total[tuple(shifted[0])] + total[tuple(shifted[1])] + total[tuple(shifted[2])]
+
+    return total
+
+
+def _live_bounds(cells, offset):
+    """Returns the per-axis (start, stop) of the live cubes, shifted by offset, or None if none are live"""
+    bounds = []
+
+    for axis in range(cells.ndim):
+        other_axes = tuple(a for a in range(cells.ndim) if a != axis)
+        live = np.flatnonzero(cells.any(axis=other_axes))
+        if not len(live):
+            return None
+        bounds.append((offset[axis] + live[0], offset[axis] + live[-1] + 1))
+
+    return bounds
+
+
+def dense_boot(initial_slice, ndim, cycles):
+    """Boots in a dense bool volume and returns the number of active cubes
+
+    Two buffers sized for the final volume are swapped every cycle, and each cycle only
+    works on the bounding box of the live cubes grown by one.
+    """
+    if not initial_slice:
+        return 0
+    margin = cycles + 2
+    extent = [max(cube[0] for cube in initial_slice) + 1, max(cube[1] for cube in initial_slice) + 1]
+    extent += [1] * (ndim - 2)
+    shape = tuple(size + 2 * margin for size in extent)
+
+    current = np.zeros(shape, dtype=bool)
+    following = np.zeros(shape, dtype=bool)
+    for x, y in initial_slice:
+        current[(x + margin, y + margin) + (margin,) * (ndim - 2)] = True
+    bounds = _live_bounds(current, [0] * ndim)
+    following_bounds = None
+
+    for _ in range(cycles):
+        window = tuple(slice(start - 2, stop + 2) for start, stop in bounds)
+        region = tuple(slice(start - 1, stop + 1) for start, stop in bounds)
+
+        box = _box_sum(current[window])
+        if following_bounds is not None:
+            following[tuple(slice(start, stop) for start, stop in following_bounds)] = False
+        # The box includes the cube itself, so an active cube with 2 or 3 neighbors sums to 3 or 4
+        following[region] = (box == 3) | (current[region] & (box == 4))
+
+        following_bounds = bounds
+        bounds = _live_bounds(following[region], [start - 1 for start, _ in bounds])
+        current, following = following, current
+        if bounds is None:
+            return 0
+
+    return int(np.count_nonzero(current))
+
+
+def get_active_count_after_boot(initial_slice, ndim=3, cycles=CYCLES_TO_BOOT, mode='sparse'):
+    """Simulates the boot cycle in ndim dimensions and returns the number of active cubes
+
+    Cubes are keyed by packed ints so that a neighbor is a single addition away. The
+    active region grows by at most one cube per axis per cycle, which bounds each digit.
+
+    The initial slice is planar, so every axis past y stays mirror symmetric. The folded
+    mode only simulates the non-negative half of those axes and multiplies each cube back
+    out by its reflections at the end. The dense mode boots in a bool volume instead.
+    """
+    padding = (0,) * (ndim - 2)
+    extent = max(max(cube) for cube in initial_slice) + 1 if initial_slice else 1
+    bias = cycles + 1
+    base = extent + 2 * bias
+
+    active = {_pack(cube + padding, base, bias) for cube in initial_slice}
+    offsets = get_neighbor_offsets(ndim)
+
+    if mode == 'sparse':
+        deltas = [_pack(offset, base, 0) for offset in offsets]
+        for _ in range(cycles):
+            active = boot_cycle(active, deltas)
+        return len(active)
+
+    if mode == 'folded':
+        delta_cache = {}
+        for _ in range(cycles):
+            active = folded_boot_cycle(active, offsets, base, bias, ndim, delta_cache)
+        return sum(2 ** sum(coord != 0 for coord in _extra_axes_pattern(cube, base, bias, ndim))
+                   for cube in active)
+
+    if mode == 'dense':
+        return dense_boot(initial_slice, ndim, cycles)
+
+    raise ValueError('Unknown boot mode: {}'.format(mode))
 
 
 def main():
@@ -121,14 +220,13 @@ def main():
     ####################
     #      Part 1      #
     ####################
-    num_active_cubes = get_active_count_after_boot(initial_state)
+    num_active_cubes = get_active_count_after_boot(initial_state, ndim=3, cycles=args.cycles, mode=args.mode)
     print("[Part 1]\nNumber of Active Cubes After Boot: {}\n".format(num_active_cubes))
     
     ####################
     #      Part 2      #
     ####################
-    initial_state = get_inputs(args.input_file, ndim=4)
-    num_active_cubes = get_active_count_after_boot(initial_state)
+    num_active_cubes = get_active_count_after_boot(initial_state, ndim=4, cycles=args.cycles, mode=args.mode)
     print("[Part 2]\nNumber of Active Cubes After Boot: {}".format(num_active_cubes))
 
 
@@ -1,10 +1,16 @@
 from collections import defaultdict
+import numpy as np
 import argparse
+import hashlib
+import os
+import re
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--cache_dir', '-c', help='Directory to cache compiled rules in.')
+    parser.add_argument('--engine', '-e', help='Matching engine.', choices=['regex', 'chart'], default='regex')
 
     return parser.parse_args()
 
@@ -34,85 +40,333 @@ def get_inputs(input_file):
     return inputs
 
 
-def message_is_valid(rule_id, rules, message):
-    """Checks if message is valid, -1 if not, otherwise the length of message"""
-    if not len(message):
-        return -1
+def get_part2_rules(rules):
+    """Returns a copy of the rules with the looping replacements for rules 8 and 11"""
+    new_rules = defaultdict(list, {rule_id: list(rule) for rule_id, rule in rules.items()})
+    new_rules['8'] = [['42'], ['42', '8']]
+    new_rules['11'] = [['42', '31'], ['42', '11', '31']]
 
-    # Base case
-    if rules[rule_id] == [['a']] or rules[rule_id] == [['b']]:
-        if message[0] == rules[rule_id][0][0]:
-            return 1
-        else:
-            return -1
-
-    for sub_list in rules[rule_id]:
-        count = 0
-        for sub_rule in sub_list:
-            res = message_is_valid(sub_rule, rules, message[count:])
-            if res > 0:
-                count += res
+    return new_rules
+
+
+def _is_terminal(sub_rule):
+    return sub_rule in ('a', 'b')
+
+
+def get_min_lengths(rules):
+    """Returns the length of the shortest message each rule can match"""
+    min_lengths = {}
+    changed = True
+
+    while changed:
+        changed = False
+        for rule_id, rule in rules.items():
+            lengths = [sum(1 if _is_terminal(sub_rule) else min_lengths[sub_rule] for sub_rule in sub_list)
+                       for sub_list in rule
+                       if all(_is_terminal(sub_rule) or sub_rule in min_lengths for sub_rule in sub_list)]
+            if lengths and min(lengths) < min_lengths.get(rule_id, float('inf')):
+                min_lengths[rule_id] = min(lengths)
+                changed = True
+
+    return min_lengths
+
+
+def get_looping_rules(rules):
+    """Returns the rules that can reach a loop, whose expansion depends on how deep it goes"""
+    children = {rule_id: {sub_rule for sub_list in rule for sub_rule in sub_list if not _is_terminal(sub_rule)}
+                for rule_id, rule in rules.items()}
+
+    def reachable(rule_id):
+        seen, stack = set(), list(children.get(rule_id, ()))
+        while stack:
+            child = stack.pop()
+            if child not in seen:
+                seen.add(child)
+                stack.extend(children.get(child, ()))
+        return seen
+
+    reach = {rule_id: reachable(rule_id) for rule_id in rules}
+    in_loop = {rule_id for rule_id in rules if rule_id in reach[rule_id]}
+
+    return {rule_id for rule_id in rules if rule_id in in_loop or reach[rule_id] & in_loop}
+
+
+def compile_rule_pattern(rules, rule_id, max_length):
+    """Compiles a rule into a regular expression string
+
+    Looping rules are expanded only as far as a message of max_length could need. Each
+    rule is expanded within a budget of characters left for it, which is its parent's
+    budget less the shortest matches of its siblings, and a rule whose shortest match
+    is over budget is dropped.
+
+    >>> rules = {'0': [['1']], '1': [['3', '1'], ['2']], '2': [['3'] * 5], '3': [['a']]}
+    >>> regex = re.compile(compile_rule_pattern(rules, '0', 17))
+    >>> [bool(regex.fullmatch('a' * length)) for length in (4, 5, 12, 17)]
+    [False, True, True, True]
+    """
+    min_lengths = get_min_lengths(rules)
+    looping = get_looping_rules(rules)
+    cache = {}
+    # Depth of each (rule, budget) being expanded, and the shallowest one a cycle cut back to
+    expanding = {}
+    lowest_cut = float('inf')
+
+    def expand(rule_id, budget):
+        nonlocal lowest_cut
+        if rule_id not in min_lengths or min_lengths[rule_id] > budget:
+            return None
+        if rule_id not in looping:
+            budget = max_length
+        key = (rule_id, budget)
+        if key in cache:
+            return cache[key]
+        # Re-entering a rule on the same budget is a cycle that matches nothing new, but
+        # rules expanded inside it miss what the cut rule matches, so are not cached
+        if key in expanding:
+            lowest_cut = min(lowest_cut, expanding[key])
+            return None
+
+        depth = expanding[key] = len(expanding)
+        outer_cut, lowest_cut = lowest_cut, float('inf')
+        alternatives = []
+        for sub_list in rules[rule_id]:
+            lengths = [1 if _is_terminal(sub_rule) else min_lengths.get(sub_rule, max_length + 1)
+                       for sub_rule in sub_list]
+            if sum(lengths) > budget:
+                continue
+            parts = []
+            for sub_rule, length in zip(sub_list, lengths):
+                part = sub_rule if _is_terminal(sub_rule) else expand(sub_rule, budget - sum(lengths) + length)
+                if part is None:
+                    break
+                parts.append(part)
             else:
-                break
-        else:
-            return count
-    return -1
-
-# Example
-# 31
-# 14 17
-# b 14 2
-# b b 1 24
-# b b a 14 1
-# b b a b 1
-# last section has to be length of 5
-
-# Actual input
-# 31 
-# 43 44
-# a 88 43
-# a 43 26 a
-# a a 35 38 a
-# a a b 35 56 a
-# a a b b 14 35 a
-# a a b b 35 35 b a
-# a a b b b b b a
-# last section has to be length of 8
-#
-# 42
-# 43 106
-# a 33 43
-# a 96 43 a
-# a 35 127 a a
-# a b 43 110 a a
-# a b a 43 92 a a
-# a b a a 35 43 a a
-# a b a a b a a a
-# last section is length of 8 as well
-
-def get_num_msgs_match_rule(rules, messages, part=1):
-    """Returns the total number of messages that match the rules"""
-    num_valid_msgs = 0
-
-    for message in messages:
-        if part == 1:
-            if message_is_valid("0", rules, message) == len(message):
-                num_valid_msgs += 1
+                alternatives.append(''.join(parts))
+        del expanding[key]
+
+        pattern = '(?:{})'.format('|'.join(alternatives)) if alternatives else None
+        if lowest_cut >= depth:
+            cache[key] = pattern
+            lowest_cut = outer_cut
         else:
-            sub_messages = [message[i:i+8] for i in range(0, len(message), 8)]
-
-            for n in range(1, (len(sub_messages) - 1) // 2 + 1):
-                if all(
-                    message_is_valid("42", rules, sub_msg) == len(sub_msg)
-                    for sub_msg in sub_messages[:-n]
-                ) and all(
-                    message_is_valid("31", rules, sub_msg) == len(sub_msg)
-                    for sub_msg in sub_messages[-n:]
-                ):
-                    num_valid_msgs += 1
-                    break
-    
-    return num_valid_msgs
+            lowest_cut = min(outer_cut, lowest_cut)
+        return pattern
+
+    return expand(rule_id, max_length) or '(?!)'
+
+
+# Bumped whenever compile_rule_pattern changes, so stale cached patterns are not reused
+PATTERN_VERSION = 2
+
+
+def get_rules_hash(rules, rule_id, max_length):
+    """Returns a hash of the rules block, used to key the compiled pattern cache"""
+    rules_block = '\n'.join('{}: {}'.format(key, ' | '.join(' '.join(sub_list) for sub_list in rules[key]))
+                            for key in sorted(rules))
+    key = '{}\n{}\n{}\n{}'.format(PATTERN_VERSION, rules_block, rule_id, max_length)
+
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def compile_rule(rules, rule_id, max_length, cache_dir=None):
+    """Returns the compiled regex for a rule, loading and saving its pattern in cache_dir if given"""
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, '{}.re'.format(get_rules_hash(rules, rule_id, max_length)))
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as infile:
+                return re.compile(infile.read())
+
+    pattern = compile_rule_pattern(rules, rule_id, max_length)
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w') as outfile:
+            outfile.write(pattern)
+
+    return re.compile(pattern)
+
+
+class Grammar:
+    """Rules compiled to integer symbols for chart parsing arbitrary, even left-recursive, rules
+
+    The chart is the (rule, start, end) memo table for a batch of same-length messages,
+    each cell a bitset with bit m set when the symbol matches message m from start to
+    end. Charts are filled from the last start backwards. At a given start, a rule
+    only waits on the first symbol of each alternative there, so rules are ordered by
+    that left-corner dependency and only left-recursive groups iterate to a fixed point.
+    """
+    def __init__(self, rules, start_rule='0'):
+        reachable = [start_rule]
+        seen = {start_rule}
+        for rule_id in reachable:
+            for sub_list in rules[rule_id]:
+                for sub_rule in sub_list:
+                    if sub_rule in rules and sub_rule not in seen:
+                        seen.add(sub_rule)
+                        reachable.append(sub_rule)
+
+        terminals = sorted({sub_rule for rule_id in reachable for sub_list in rules[rule_id]
+                            for sub_rule in sub_list if sub_rule not in rules})
+        self.terminal_ids = {terminal: index for index, terminal in enumerate(terminals)}
+        symbol_ids = dict(self.terminal_ids)
+        for rule_id in reachable:
+            symbol_ids[rule_id] = len(symbol_ids)
+        self.num_symbols = len(symbol_ids)
+        self.start = symbol_ids[start_rule]
+
+        self.alternatives = [[] for _ in range(self.num_symbols)]
+        for rule_id in reachable:
+            for sub_list in rules[rule_id]:
+                if not sub_list:
+                    raise ValueError('Rule {} has an empty alternative'.format(rule_id))
+                self.alternatives[symbol_ids[rule_id]].append(tuple(symbol_ids[sub_rule] for sub_rule in sub_list))
+
+        left_corners = {symbol_ids[rule_id]: {alternative[0] for alternative in self.alternatives[symbol_ids[rule_id]]
+                                              if alternative[0] >= len(terminals)}
+                        for rule_id in reachable}
+        self.groups = self._order_groups(left_corners)
+
+    @staticmethod
+    def _order_groups(left_corners):
+        """Returns (rules, looping) groups, each after every group its left corners fall in
+
+        This is Tarjan's strongly connected components algorithm, which finishes each
+        component only after everything it reaches.
+        """
+        index, lowlink, on_stack, stack, groups = {}, {}, set(), [], []
+
+        def connect(rule):
+            index[rule] = lowlink[rule] = len(index)
+            stack.append(rule)
+            on_stack.add(rule)
+            for corner in left_corners[rule]:
+                if corner not in index:
+                    connect(corner)
+                    lowlink[rule] = min(lowlink[rule], lowlink[corner])
+                elif corner in on_stack:
+                    lowlink[rule] = min(lowlink[rule], index[corner])
+            if lowlink[rule] == index[rule]:
+                group = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    group.append(member)
+                    if member == rule:
+                        break
+                looping = len(group) > 1 or rule in left_corners[rule]
+                groups.append((group, looping))
+
+        for rule in left_corners:
+            if rule not in index:
+                connect(rule)
+
+        return groups
+
+    def _fill_chart(self, messages):
+        """Fills the chart for a batch of same-length messages and returns the start rule's matches
+
+        Message m is bit m of word m // 64 in every chart cell, so each step below runs
+        on the whole batch at once.
+        """
+        num_messages, length = messages.shape
+        words = -(-num_messages // 64)
+        alternatives = self.alternatives
+        chart = np.zeros((self.num_symbols, length + 1, length + 1, words), dtype=np.uint64)
+
+        # reach[symbol][start] holds the ends any message may reach, so dead cells are skipped
+        # without touching the chart. It can overshoot, which only costs some empty rows
+        reach = [[()] * (length + 1) for _ in range(self.num_symbols)]
+        positions = np.arange(length)
+        for terminal, symbol in self.terminal_ids.items():
+            hits = np.zeros((words * 64, length), dtype=bool)
+            hits[:num_messages] = messages == ord(terminal)
+            packed = np.packbits(hits, axis=0, bitorder='little')
+            chart[symbol, positions, positions + 1] = np.ascontiguousarray(packed.T).view(np.uint64)
+            reach[symbol] = [(position + 1,) for position in range(length)] + [()]
+            for position in np.flatnonzero(~hits[:num_messages].any(axis=0)):
+                reach[symbol][position] = ()
+
+        for start in range(length - 1, -1, -1):
+            for group, looping in self.groups:
+                changed = True
+                while changed:
+                    changed = False
+                    for rule in group:
+                        rule_ends = None
+                        rule_rows = set()
+                        for alternative in alternatives[rule]:
+                            rows = reach[alternative[0]][start]
+                            if not rows:
+                                continue
+                            ends = chart[alternative[0], start]
+                            for symbol in alternative[1:]:
+                                next_rows = set()
+                                for row in rows:
+                                    next_rows.update(reach[symbol][row])
+                                if not next_rows:
+                                    break
+                                if len(rows) == 1:
+                                    ends = chart[symbol, rows[0]] & ends[rows[0]]
+                                else:
+                                    ends = np.bitwise_or.reduce(chart[symbol, rows] & ends[rows, None], axis=0)
+                                rows = sorted(next_rows)
+                            else:
+                                if rule_ends is None:
+                                    rule_ends = ends.copy()
+                                else:
+                                    rule_ends |= ends
+                                rule_rows.update(rows)
+                        if rule_ends is None:
+                            continue
+                        if looping and not np.array_equal(rule_ends, chart[rule, start]):
+                            changed = True
+                        chart[rule, start] = rule_ends
+                        reach[rule][start] = sorted(rule_rows)
+
+        matched = np.unpackbits(chart[self.start, 0, length].view(np.uint8), bitorder='little')
+        return matched[:num_messages].astype(bool)
+
+    def match_messages(self, messages, chart_bytes=1 << 28):
+        """Returns whether each message fully matches the start rule
+
+        Messages are grouped by length and matched in batches sharing one chart, sized to
+        keep the chart within about chart_bytes.
+        """
+        by_length = defaultdict(list)
+        for index, message in enumerate(messages):
+            by_length[len(message)].append(index)
+
+        matches = [False] * len(messages)
+        for length, indices in by_length.items():
+            if not length:
+                continue
+            bytes_per_message = self.num_symbols * (length + 1) ** 2 / 8
+            batch_size = max(64, int(chart_bytes / bytes_per_message) // 64 * 64)
+            for batch_start in range(0, len(indices), batch_size):
+                batch = indices[batch_start:batch_start+batch_size]
+                codes = np.frombuffer(''.join(messages[index] for index in batch).encode(),
+                                      dtype=np.uint8).reshape(len(batch), length)
+                for index, matched in zip(batch, self._fill_chart(codes)):
+                    matches[index] = bool(matched)
+
+        return matches
+
+
+def get_num_msgs_match_rule(rules, messages, part=1, cache_dir=None, engine='regex'):
+    """Returns the total number of messages that match the rules
+
+    The regex engine bounds how deep looping rules unroll, the chart engine handles any rules.
+    """
+    if part == 2:
+        rules = get_part2_rules(rules)
+
+    if engine == 'chart':
+        return sum(Grammar(rules).match_messages(messages))
+
+    max_length = max((len(message) for message in messages), default=0)
+    rule_regex = compile_rule(rules, '0', max_length, cache_dir=cache_dir)
+
+    return sum(1 for message in messages if rule_regex.fullmatch(message))
 
 
 def main():
@@ -124,13 +378,15 @@ def main():
     ####################
     #      Part 1      #
     ####################
-    num_match_rule = get_num_msgs_match_rule(rules, messages)
+    num_match_rule = get_num_msgs_match_rule(rules, messages, cache_dir=args.cache_dir,
+                                             engine=args.engine)
     print("[Part 1]\nNumber of Messages Matching Rule 0: {}\n".format(num_match_rule))
 
     ####################
     #      Part 2      #
     ####################
-    num_match_rule = get_num_msgs_match_rule(rules, messages, part=2)
+    num_match_rule = get_num_msgs_match_rule(rules, messages, part=2, cache_dir=args.cache_dir,
+                                             engine=args.engine)
     print("[Part 2]\nNumber of Messages Matching Rule 0: {}".format(num_match_rule))
     
 
@@ -3,184 +3,163 @@ import argparse
 import numpy as np
 
 
+def reverse_code(code, width):
+    """Returns an edge code read the other way"""
+    return int(format(code, '0{}b'.format(width))[::-1], 2)
+
+
+def canonical_edge_code(code, width):
+    """Returns the edge code of a side regardless of which way it is read"""
+    return min(code, reverse_code(code, width))
+
+
 class Tile:
     def __init__(self, id, tile_data):
         self.id = id
         self.width = len(tile_data)
         self.image = self.create_image(tile_data)
-        self.sides = self.get_sides() # [top, right, bot, left]
-
+        self.orientation_sides = self.get_orientation_sides()
+        self.orientation = 0
 
     def create_image(self, tile_data):
-        """Creates a tile image from its raw data"""
-        image = np.empty([self.width, self.width], dtype=str)
-        
-        for index, line in enumerate(tile_data):
-            np.copyto(image[index], list(line))
+        """Creates a tile image from its raw data, with a 1 for every '#'"""
+        return np.array([[cell == '#' for cell in line] for line in tile_data], dtype=np.uint8)
 
-        return image
-    
-    def get_sides(self):
-        """Returns the sides of the tile"""
-        top = "".join(self.image[0])
-        bot = "".join(self.image[-1])[::-1]
-        left = "".join(self.image[:,0:1].flatten())[::-1]
-        right = "".join(self.image[:,-1:].flatten())
+    def get_sides(self, image):
+        """Returns the edge codes of an image's sides, read clockwise"""
+        weights = 1 << np.arange(self.width - 1, -1, -1)
+        top = int(image[0].dot(weights))
+        right = int(image[:, -1].dot(weights))
+        bot = int(image[-1, ::-1].dot(weights))
+        left = int(image[::-1, 0].dot(weights))
 
         return [top, right, bot, left]
 
-    def invert(self):
-        """Inverts the tile"""
-        self.rotate()
-        self.image = np.flip(self.image, axis=0)
-        self.sides = self.get_sides()
-    
-    def flip_side(self):
-        """Flips the tile side to side"""
-        self.image = np.flip(self.image, 1)
-        self.sides = self.get_sides()
+    def get_orientation_sides(self):
+        """Returns the sides of all 8 orientations, indexed by 4 * flipped + clockwise turns
 
-    def rotate(self, direction='cw'):
-        """Rotates a tile"""
-        if direction == 'cw':
-            self.image = np.rot90(self.image, axes=(1,0))
-        elif direction == 'cc':
-            self.image = np.rot90(self.image)
-        self.sides = self.get_sides()
+        Turning clockwise moves each side one place round, and flipping side to side swaps
+        left and right, reversing every side. Neither needs the image to be touched.
+        """
+        sides = self.get_sides(self.image)
+        flipped = [reverse_code(side, self.width) for side in (sides[0], sides[3], sides[2], sides[1])]
+        orientation_sides = []
+
+        for base in (sides, flipped):
+            for turns in range(4):
+                orientation_sides.append(base[-turns:] + base[:-turns] if turns else base)
+
+        return orientation_sides
+
+    @property
+    def sides(self):
+        """The [top, right, bot, left] edge codes in the current orientation"""
+        return self.orientation_sides[self.orientation]
+
+    def get_oriented_image(self):
+        """Returns the image turned to the current orientation"""
+        flipped, turns = divmod(self.orientation, 4)
+        image = np.flip(self.image, axis=1) if flipped else self.image
+
+        return np.rot90(image, k=turns, axes=(1, 0))
 
 
 class Jigsaw:
     def __init__(self, tiles):
         self.puzzle_width = int(np.sqrt(len(tiles)))
-        self.tiles = tiles
+        self.tiles = {tile.id: tile for tile in tiles}
+        self.edge_index = self.build_edge_index()
         self.puzzle = np.empty([self.puzzle_width, self.puzzle_width], dtype=object)
         self.solve_puzzle()
         self.create_full_picture()
 
-    def rotate_board(self):
-        """Rotates the board and all of its tiles"""
-        self.puzzle = np.rot90(self.puzzle)
-        for row in self.puzzle:
-            for col in row:
-                if col is not None:
-                    col.rotate(direction='cc')
-
-    def flip_pieces(self):
-        """Flips the board in case wrong orientation, should only be called once"""
-        for row in self.puzzle:
-            for col in row:
-                if col is not None:
-                    col.flip_side()
-
-    def is_match(self, ref_tile, comp_tile):
-        """Quick check whether the the tiles fit each other"""
-        for i in range(4):
-            if comp_tile.sides[i] in ref_tile.sides or comp_tile.sides[i][::-1] in ref_tile.sides:
-                return i
-        return -1
-
-    def get_num_matching_sides(self, ref_tile):
-        """Returns the number of sides that match the tile"""
-        num_match = 0
-
-        for tile in self.tiles:
-            if tile == ref_tile:
-                continue
-            else:
-                num_match = num_match + 1 if self.is_match(ref_tile, tile) >= 0 else num_match
-
-        return num_match
-
-    def get_corner(self):
-        """Finds a corner piece"""
-        for tile in self.tiles:
-            if self.get_num_matching_sides(tile) <= 2:
-                return tile
-
-    def pop_tile(self, tile_id):
-        """Pops a tile off its list based on its ID"""
-        self.tiles = [tile for tile in self.tiles if tile.id != tile_id]
-        
-    def try_tile(self, tile_ref, tile_comp):
-        """Tries to fit a tile to the left of one"""
-        if tile_ref.id == tile_comp.id:
-            return False
-
-        for _ in range(2):
-            for _ in range(4):
-                if tile_ref.sides[1] == tile_comp.sides[3][::-1]:
-                    return True
-                tile_comp.rotate()
-            tile_comp.invert()
-
-        return False
-
-    def find_right_match(self, tile_ref):
-        """Finds the matching tile to its right"""
-        for _ in range(2): # Flip at least once
-            for tile in self.tiles:
-                if self.try_tile(tile_ref, tile):
-                    return tile
-            self.flip_pieces()
+    def build_edge_index(self):
+        """Maps each canonical edge code to the IDs of the tiles having that edge"""
+        edge_index = defaultdict(list)
+
+        for tile in self.tiles.values():
+            for side in tile.sides:
+                edge_index[canonical_edge_code(side, tile.width)].append(tile.id)
+
+        return edge_index
+
+    def get_neighbor(self, tile, side_index):
+        """Returns the tile sharing the given side of a tile, or None on the outer border"""
+        tile_ids = self.edge_index[canonical_edge_code(tile.sides[side_index], tile.width)]
+        if len(tile_ids) > 2:
+            raise ValueError('Edge of {} matches more than one tile'.format(tile.id))
+
+        for tile_id in tile_ids:
+            if tile_id != tile.id:
+                return self.tiles[tile_id]
 
         return None
 
+    def get_num_matching_sides(self, tile):
+        """Returns the number of sides that match another tile"""
+        return sum(self.get_neighbor(tile, i) is not None for i in range(4))
+
+    def get_corners(self):
+        """Returns the corner pieces, which only match two other tiles"""
+        return [tile for tile in self.tiles.values() if self.get_num_matching_sides(tile) == 2]
+
+    def get_border_tiles(self):
+        """Returns the non-corner pieces of the outer border"""
+        return [tile for tile in self.tiles.values() if self.get_num_matching_sides(tile) == 3]
+
+    def orient_tile(self, tile, side_index, side):
+        """Picks the orientation of a tile in which the given side reads as expected"""
+        for orientation, sides in enumerate(tile.orientation_sides):
+            if sides[side_index] == side:
+                tile.orientation = orientation
+                return
+
+        raise ValueError('{} has no side {}'.format(tile.id, side))
+
     def solve_puzzle(self):
-        """Solve the puzzle by arranging tiles properly
-            
-            Algorithm: The algorithm revolves around solving a corner, then the border. 
-                       Once the border is complete, solve the next inner layer, until one
-                       piece remains.
-
-                1. Find a corner
-                2. Place a corner piece on the board
-                3. Try to find a matching tile with its previous tile
-                4. If no more matches, one side of border is complete, rotate the board
-                5. Once board has rotated 4 times, repeat steps with the next inner layer
+        """Solve the puzzle by walking the board from a corner
+
+            Algorithm: Every edge is shared by at most two tiles, so the neighbors of a placed
+                       tile are a lookup in the edge index away.
+
+                1. Place a corner so its unmatched sides face up and left
+                2. Fill each row left to right with the tile sharing the right side of the
+                   previous tile
+                3. Start each new row with the tile sharing the bottom side of the tile above
         """
-        layer = 0
-        while len(self.tiles):
-            corner = self.get_corner()
-            self.pop_tile(corner.id)
-            if self.puzzle[layer][layer] is None:
-                if not layer:
-                    self.puzzle[layer][layer] = corner
+        corner = self.get_corners()[0]
+        for turns in range(4):
+            corner.orientation = turns
+            if self.get_neighbor(corner, 0) is None and self.get_neighbor(corner, 3) is None:
+                break
+        self.puzzle[0][0] = corner
+
+        for row in range(self.puzzle_width):
+            for col in range(self.puzzle_width):
+                if col:
+                    ref = self.puzzle[row][col-1]
+                    tile = self.get_neighbor(ref, 1)
+                    self.orient_tile(tile, 3, reverse_code(ref.sides[1], ref.width))
+                elif row:
+                    ref = self.puzzle[row-1][col]
+                    tile = self.get_neighbor(ref, 2)
+                    self.orient_tile(tile, 0, reverse_code(ref.sides[2], ref.width))
                 else:
-                    for _ in range(4):
-                        if self.try_tile(self.puzzle[layer][layer-1], corner):
-                            self.puzzle[layer][layer] = corner
-                            break
-                        self.rotate_board()
-            for _ in range(4):
-                for i in range(1, len(self.puzzle[0])-2*layer):
-                    right_match = self.find_right_match(self.puzzle[layer][layer+i-1])
-                    if right_match is None:
-                        break
-                    self.puzzle[layer][layer+i] = right_match
-                    self.pop_tile(right_match.id)
-                self.rotate_board()
-            layer += 1
+                    continue
+                self.puzzle[row][col] = tile
 
     def create_full_picture(self):
         """Creates the full picture from the solved puzzle and removed borders"""
         tile_width = self.puzzle[0][0].width - 2
         full_picture_width = self.puzzle_width * tile_width
-        full_picture = np.empty([full_picture_width, full_picture_width], dtype=str)
+        full_picture = np.empty([full_picture_width, full_picture_width], dtype=np.uint8)
 
         for row in range(len(self.puzzle)):
             for col in range(len(self.puzzle[0])):
-                full_picture[row*tile_width:row*tile_width+tile_width,col*tile_width:col*tile_width+tile_width] = self.puzzle[row][col].image[1:-1,1:-1]
+                full_picture[row*tile_width:row*tile_width+tile_width,col*tile_width:col*tile_width+tile_width] = self.puzzle[row][col].get_oriented_image()[1:-1,1:-1]
 
         self.full_picture = full_picture
 
-    def rotate_picture(self):
-        """Rotates the picture"""
-        self.full_picture = np.rot90(self.full_picture)
-
-    def invert_picture(self):
-        """Inverts the picture"""
-        self.full_picture = np.flip(np.rot90(self.full_picture), axis=0)
-
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
@@ -221,15 +200,48 @@ def get_monster(monster_file):
 
     return monster
 
-def get_monster_indices(monster):
-    """Returns a list of indices of the monster"""
-    indices = []
-    for row in range(len(monster)):
-        for col in range(len(monster[0])):
-            if monster[row][col] == '#':
-                indices.append((row, col))
-
-    return indices
+def get_monster_pattern(monster):
+    """Returns the monster as a bool array, True for each of its '#'s"""
+    width = max(len(line) for line in monster)
+
+    return np.array([[cell == '#' for cell in line.ljust(width)] for line in monster], dtype=bool)
+
+def get_orientations(pattern):
+    """Returns the 8 rotations and flips of a pattern"""
+    orientations = []
+    for image in (pattern, np.flip(pattern, axis=1)):
+        for turns in range(4):
+            orientations.append(np.rot90(image, k=turns, axes=(1, 0)))
+
+    return orientations
+
+def scan_patterns(picture, patterns):
+    """Finds every placement of a batch of patterns in a bool picture
+
+    Returns a (num_patterns, height, width) array of the top left corners of each match and
+    a mask of the picture pixels covered by any match. The correlation is one shifted AND
+    per pattern pixel offset, shared by every pattern using that offset.
+    """
+    height, width = picture.shape
+    size = max(max(pattern.shape) for pattern in patterns)
+    stacked = np.zeros((len(patterns), size, size), dtype=bool)
+    for index, pattern in enumerate(patterns):
+        stacked[index, :pattern.shape[0], :pattern.shape[1]] = pattern
+    offsets = np.argwhere(stacked.any(axis=0))
+
+    # Padding lets matches hang off the bottom right, where they fail on the blank pixels
+    padded = np.zeros((height + size, width + size), dtype=bool)
+    padded[:height, :width] = picture
+    matches = np.ones((len(patterns), height, width), dtype=bool)
+    for row, col in offsets:
+        users = stacked[:, row, col]
+        matches[users] &= padded[row:row+height, col:col+width]
+
+    covered = np.zeros_like(padded)
+    for row, col in offsets:
+        covered[row:row+height, col:col+width] |= matches[stacked[:, row, col]].any(axis=0)
+
+    return matches, covered[:height, :width]
 
 def get_corner_tiles_product(jigsaw):
     """Returns the product of the corners' tile IDs"""
@@ -243,32 +255,17 @@ def get_corner_tiles_product(jigsaw):
     return product
 
 def get_monsters_units(jigsaw, monster):
-    """Returns the number of #'s belonging to monsters"""
-    num_monsters = 0
-    height = len(monster)
-    length = len(monster[0])
-    indices = get_monster_indices(monster)
-
-    for _ in range(2):
-        for _ in range(4):
-            for row in range(len(jigsaw.full_picture)-height):
-                for col in range(len(jigsaw.full_picture[0])-length):
-                    for index in indices:
-                        if jigsaw.full_picture[row+index[0],col+index[1]] != '#':
-                            break
-                    else:
-                        num_monsters += 1
-            jigsaw.rotate_picture()
-        jigsaw.invert_picture()
-
-    return num_monsters * len(indices)
+    """Returns the number of #'s belonging to monsters, counting overlapping monsters once"""
+    patterns = get_orientations(get_monster_pattern(monster))
+    _matches, covered = scan_patterns(jigsaw.full_picture.astype(bool), patterns)
+
+    return int(np.count_nonzero(covered))
 
 def count_waters(jigsaw, monster):
     """Returns the difference of all #'s and the ones of the monsters"""
     monster_size = get_monsters_units(jigsaw, monster)
-    _values, occurences = np.unique(jigsaw.full_picture, return_counts=True)
     
-    return occurences[0] - monster_size
+    return int(np.count_nonzero(jigsaw.full_picture)) - monster_size
 
 
 def main():
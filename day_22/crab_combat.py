@@ -1,9 +1,14 @@
+from collections import deque, OrderedDict
+from itertools import islice
 import argparse
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--cache_size', '-c', type=int, default=100000,
+                        help='Number of sub-game winners to remember.')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print Recursive Combat counters.')
 
     return parser.parse_args()
 
@@ -28,55 +33,99 @@ def get_inputs(input_file):
 
 def play_combat(player1, player2):
     """Plays out a game of Combat and returns the winning hand"""
-    while len(player1) and len(player2):
-        p1_card = player1.pop(0)
-        p2_card = player2.pop(0)
+    player1, player2 = deque(player1), deque(player2)
+    while player1 and player2:
+        p1_card = player1.popleft()
+        p2_card = player2.popleft()
         if p1_card > p2_card:
             player1.append(p1_card)
             player1.append(p2_card)
         else:
             player2.append(p2_card)
             player2.append(p1_card)
-    return player1 if len(player1) else player2
-
+    return player1 if player1 else player2
+
+
+class RecursiveCombat:
+    """Plays Recursive Combat, remembering the winners of recent sub-games
+
+    Sub-game winners are cached on both starting decks, evicting the least recently
+    used once cache_size games are stored. Counters track cache hits, sub-games spawned
+    and the deepest recursion reached.
+    """
+    def __init__(self, cache_size=100000):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.sub_games = 0
+        self.max_depth = 0
+
+    def sub_game_winner(self, player1, player2, depth):
+        """Returns the winner of a sub-game started from the two decks"""
+        self.sub_games += 1
+        self.max_depth = max(self.max_depth, depth)
+
+        # Cards are distinct, so the highest is at least the number of cards in play, more than
+        # either player can ever hold once it is drawn. Whoever holds it never recurses on it
+        # and never loses it, and a repeated state also goes to player 1, so player 1 wins
+        if max(player1) > max(player2) and max(player1) > len(player1) + len(player2) - 2:
+            return 'p1'
+
+        key = (tuple(player1), tuple(player2))
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        winner, _ = self.play(player1, player2, depth)
+        self.cache[key] = winner
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return winner
+
+    def play(self, player1, player2, depth=0):
+        """Plays out a game of Recursive Combat and returns the winner and the hand"""
+        player1, player2 = deque(player1), deque(player2)
+        seen_states = set()
+        while player1 and player2:
+            state = (tuple(player1), tuple(player2))
+            if state in seen_states:
+                return ('p1', player1)
+            seen_states.add(state)
+
+            p1_card = player1.popleft()
+            p2_card = player2.popleft()
+            if p1_card <= len(player1) and p2_card <= len(player2):
+                p1_wins = self.sub_game_winner(list(islice(player1, p1_card)),
+                                               list(islice(player2, p2_card)), depth + 1) == 'p1'
+            else:
+                p1_wins = p1_card > p2_card
 
-def play_recursive_combat(player1, player2):
-    """Plays out a game of Recursive Combat and returns the winner and the hand"""
-    p1_history = []
-    while len(player1) and len(player2):
-        p1_copy = player1.copy()
-        p1_card = player1.pop(0)
-        p2_card = player2.pop(0)
-
-        if player1 in p1_history:
-            return ('p1', player1)
-        if p1_card <= len(player1) and p2_card <= len(player2):
-            winner, _ = play_recursive_combat(player1[:p1_card], player2[:p2_card])
-            if winner == 'p1':
+            if p1_wins:
                 player1.append(p1_card)
                 player1.append(p2_card)
             else:
                 player2.append(p2_card)
                 player2.append(p1_card)
-        elif p1_card > p2_card:
-            player1.append(p1_card)
-            player1.append(p2_card)
-        else:
-            player2.append(p2_card)
-            player2.append(p1_card)
-        p1_history.append(p1_copy)
-    return ('p1', player1) if len(player1) else ('p2', player2)
+        return ('p1', player1) if player1 else ('p2', player2)
+
+
+def play_recursive_combat(player1, player2, game=None):
+    """Plays out a game of Recursive Combat and returns the winner and the hand"""
+    if game is None:
+        game = RecursiveCombat()
+    return game.play(player1, player2)
 
 
-def get_winner_score(player1, player2, part=1):
+def get_winner_score(player1, player2, part=1, game=None):
     """Calculates the winning hand's score"""
     score = 0
     if part == 1:
         winner_hand = play_combat(player1, player2)
     else:
-        _, winner_hand = play_recursive_combat(player1, player2)
+        _, winner_hand = play_recursive_combat(player1, player2, game)
 
-    for index, card in enumerate(winner_hand[::-1]):
+    for index, card in enumerate(reversed(winner_hand)):
         score += (index + 1) * card
 
     return score
@@ -96,8 +145,11 @@ def main():
     ####################
     #      Part 2      #
     ####################
-    score = get_winner_score(player1, player2, part=2)
+    game = RecursiveCombat(args.cache_size)
+    score = get_winner_score(player1, player2, part=2, game=game)
     print("[Part 2]Winner's Score: {}".format(score))
+    if args.verbose:
+        print("Sub-games: {}, Cache Hits: {}, Max Depth: {}".format(game.sub_games, game.cache_hits, game.max_depth))
     
 
 if __name__ == "__main__":
@@ -1,21 +1,18 @@
+from array import array
 from collections import deque
 import numpy as np
 import cProfile
 import argparse
+import hashlib
+import zlib
+import os
 
-class CupCircle:
-    def __init__(self):
-        self.head = None
-
-class Cup:
-    def __init__(self, idx):
-        self.idx = idx
-        self.next = None
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--successor_file', '-s', help='Path to a memory-mapped successor table to play in.')
 
     return parser.parse_args()
 
@@ -37,35 +34,219 @@ def get_inputs(input_file):
     return inputs
 
 
-def play_crab_cups(cups, moves=100):
-    """Plays Crab Cups and returns the end cups"""
-    min_cup = min(cups)
-    max_cup = max(cups)
-    curr = cups[0]
-    next_cups = list(range(1, len(cups)+2))
+def build_successors(cups, num_cups=None):
+    """Returns a uint32 successor table, where the index is the cup and its value is its next cup
+
+    Cups past the given labels, up to num_cups, follow on in order before wrapping around.
+    """
+    cups = [int(cup) for cup in cups]
+    num_cups = max(num_cups or 0, len(cups))
+    successors = array('I', range(1, num_cups + 2))
+
+    for idx in range(len(cups) - 1):
+        successors[cups[idx]] = cups[idx + 1]
+    if num_cups > len(cups):
+        successors[cups[-1]] = len(cups) + 1
+        successors[num_cups] = cups[0]
+    else:
+        successors[cups[-1]] = cups[0]
 
-    # The index of next_cups is the cup itself, where its value is its next cup
-    for idx in range(len(cups)):
-        next_cups[cups[idx]] = cups[(idx+1)%len(cups)]
+    return successors
 
+
+def _play_moves(successors, curr, moves, min_cup, max_cup):
+    """Plays moves in place on the successor table and returns the current cup afterwards"""
     for _ in range(moves):
-        dest_cup = curr - 1
-        picked_cup1 = next_cups[curr]
-        picked_cup2 = next_cups[picked_cup1]
-        picked_cup3 = next_cups[picked_cup2]
-        
-        while dest_cup in [picked_cup1, picked_cup2, picked_cup3] or dest_cup < min_cup:
-            if dest_cup <= min_cup:
-                dest_cup = max_cup
+        picked_cup1 = successors[curr]
+        picked_cup2 = successors[picked_cup1]
+        picked_cup3 = successors[picked_cup2]
+
+        dest_cup = curr - 1 if curr > min_cup else max_cup
+        while dest_cup == picked_cup1 or dest_cup == picked_cup2 or dest_cup == picked_cup3:
+            dest_cup = dest_cup - 1 if dest_cup > min_cup else max_cup
+
+        successors[curr] = successors[picked_cup3]
+        successors[picked_cup3] = successors[dest_cup]
+        successors[dest_cup] = picked_cup1
+        curr = successors[curr]
+
+    return curr
+
+
+try:
+    from numba import njit
+    _play_moves_compiled = njit(cache=True)(_play_moves)
+except ImportError:
+    _play_moves_compiled = None
+
+
+def play_crab_cups(cups, moves=100, num_cups=None, compiled=None):
+    """Plays Crab Cups and returns the successor table of the end cups
+
+    The compiled kernel is used when numba is installed, unless compiled is set to False.
+    """
+    if compiled is None:
+        compiled = _play_moves_compiled is not None
+    if compiled and _play_moves_compiled is None:
+        raise ImportError('The compiled kernel requires numba')
+
+    successors = build_successors(cups, num_cups)
+    min_cup = int(min(cups))
+    max_cup = max(int(max(cups)), len(successors) - 1)
+
+    if compiled:
+        table = np.frombuffer(successors, dtype=np.uint32)
+        _play_moves_compiled(table, np.uint32(cups[0]), moves, np.uint32(min_cup), np.uint32(max_cup))
+    else:
+        _play_moves(successors, int(cups[0]), moves, min_cup, max_cup)
+
+    return successors
+
+class SuccessorFile:
+    """A crab cups successor table kept in a memory-mapped file, so games can exceed RAM
+
+    The file holds two copies of the table. Each chunk of moves is played on the copy
+    that is not committed, then committed by writing that copy's record of generation,
+    current cup and moves played, so a game killed at any point resumes from the last
+    commit. Records carry a checksum, so a torn record is ignored. The header also keeps
+    the cups the game started from. New files are built aside and moved into place once
+    complete, so a file at path without the magic number is never a successor file.
+    """
+    MAGIC = 0x5355434343323344
+    # magic, num_cups, min_cup, max_cup, cups digest, then a generation, current cup,
+    # moves played and checksum record for each table
+    HEADER_FIELDS = 16
+    RECORD_START = 5
+    RECORD_FIELDS = 4
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) < self.HEADER_FIELDS * np.dtype(np.uint64).itemsize:
+            raise ValueError('{} is not a successor file'.format(path))
+        self.header = np.memmap(path, dtype=np.uint64, mode='r+', shape=(self.HEADER_FIELDS,))
+        if int(self.header[0]) != self.MAGIC:
+            raise ValueError('{} is not a successor file'.format(path))
+        self.num_cups, self.min_cup, self.max_cup, self.cups_digest = (int(field) for field in self.header[1:5])
+        self.tables = np.memmap(path, dtype=np.uint32, mode='r+', offset=self.header.nbytes,
+                                shape=(2, self.num_cups + 1))
+
+    @staticmethod
+    def get_cups_digest(cups):
+        """Returns a 64-bit digest of the starting cups"""
+        cups = np.array([int(cup) for cup in cups], dtype=np.uint64)
+        return int.from_bytes(hashlib.sha256(cups.tobytes()).digest()[:8], 'little')
+
+    @staticmethod
+    def _record_checksum(generation, curr, played):
+        return zlib.crc32(np.array([generation, curr, played], dtype=np.uint64).tobytes()) ^ 0xFFFFFFFF
+
+    def _write_record(self, table, generation, curr, played):
+        start = self.RECORD_START + table * self.RECORD_FIELDS
+        self.header[start:start+self.RECORD_FIELDS] = [generation, curr, played,
+                                                       self._record_checksum(generation, curr, played)]
+        self.header.flush()
+
+    def committed(self):
+        """Returns the committed table's index, generation, current cup and moves played"""
+        best = None
+        for table in range(2):
+            start = self.RECORD_START + table * self.RECORD_FIELDS
+            generation, curr, played, checksum = (int(field) for field in self.header[start:start+self.RECORD_FIELDS])
+            if checksum == self._record_checksum(generation, curr, played) and (best is None or generation > best[1]):
+                best = (table, generation, curr, played)
+        if best is None:
+            raise ValueError('{} has no committed successor table'.format(self.path))
+
+        return best
+
+    @classmethod
+    def create(cls, path, cups, num_cups=None, chunk_size=1 << 22):
+        """Writes a fresh successor table for the cups to path, one chunk at a time
+
+        The file is built under path + '.tmp' and only replaces path once complete.
+        """
+        cups = [int(cup) for cup in cups]
+        num_cups = max(num_cups or 0, len(cups))
+        temp_path = path + '.tmp'
+        header = np.memmap(temp_path, dtype=np.uint64, mode='w+', shape=(cls.HEADER_FIELDS,))
+        tables = np.memmap(temp_path, dtype=np.uint32, mode='r+', offset=header.nbytes, shape=(2, num_cups + 1))
+        successors = tables[0]
+
+        for start in range(0, num_cups + 1, chunk_size):
+            end = min(start + chunk_size, num_cups + 1)
+            successors[start:end] = np.arange(start + 1, end + 1, dtype=np.uint32)
+        for cup, next_cup in zip(cups, cups[1:]):
+            successors[cup] = next_cup
+        if num_cups > len(cups):
+            successors[cups[-1]] = len(cups) + 1
+            successors[num_cups] = cups[0]
+        else:
+            successors[cups[-1]] = cups[0]
+        tables.flush()
+        del tables
+
+        header[0] = cls.MAGIC
+        header[1:5] = [num_cups, min(cups), max(max(cups), num_cups), cls.get_cups_digest(cups)]
+        start = cls.RECORD_START
+        header[start:start+cls.RECORD_FIELDS] = [1, cups[0], 0, cls._record_checksum(1, cups[0], 0)]
+        header.flush()
+        del header
+        os.replace(temp_path, path)
+
+        return cls(path)
+
+    @classmethod
+    def open(cls, path, cups, num_cups=None):
+        """Resumes the game in path, or creates it when there is no file at path
+
+        Raises ValueError if the file is not a successor file or holds a game started from
+        other cups.
+        """
+        if not os.path.exists(path):
+            return cls.create(path, cups, num_cups)
+        successor_file = cls(path)
+
+        num_cups = max(num_cups or 0, len(cups))
+        if successor_file.num_cups != num_cups or successor_file.cups_digest != cls.get_cups_digest(cups):
+            raise ValueError('{} holds a game of other cups'.format(path))
+
+        return successor_file
+
+    @property
+    def moves_played(self):
+        return self.committed()[3]
+
+    @property
+    def successors(self):
+        """The committed successor table"""
+        return self.tables[self.committed()[0]]
+
+    def play(self, moves, flush_every=10000000, compiled=None):
+        """Plays until moves in total have been played, committing every flush_every moves"""
+        if compiled is None:
+            compiled = _play_moves_compiled is not None
+        if compiled and _play_moves_compiled is None:
+            raise ImportError('The compiled kernel requires numba')
+
+        table, generation, curr, played = self.committed()
+        while played < moves:
+            chunk = min(flush_every, moves - played)
+            target = 1 - table
+            successors = self.tables[target]
+            successors[:] = self.tables[table]
+            if compiled:
+                curr = _play_moves_compiled(successors, np.uint32(curr), chunk,
+                                            np.uint32(self.min_cup), np.uint32(self.max_cup))
             else:
-                dest_cup -= 1
-        
-        next_cups[curr] = next_cups[picked_cup3]
-        next_cups[picked_cup3] = next_cups[dest_cup]
-        next_cups[dest_cup] = picked_cup1
-        curr = next_cups[curr]
+                curr = _play_moves(successors, curr, chunk, self.min_cup, self.max_cup)
+            played += chunk
+            self.tables.flush()
+            generation += 1
+            self._write_record(target, generation, int(curr), played)
+            table = target
+
+        return self.tables[table]
 
-    return next_cups
 
 def get_end_cup_labels(cups):
     """Returns the cup labels after cup 1 after playing Crab Cups"""
@@ -80,11 +261,17 @@ def get_end_cup_labels(cups):
     return cup_labels
 
 
-def get_product_star_cups(cups):
-    """Returns the product of the two cups clockwise of cup 1 after playing Crab Cups"""
-    cups = np.concatenate((cups, np.arange(len(cups)+1, 1000001)))
+def get_product_star_cups(cups, num_cups=1000000, moves=10000000, successor_file=None):
+    """Returns the product of the two cups clockwise of cup 1 after playing Crab Cups
 
-    end_cups = play_crab_cups(cups, moves=10000000)
+    With a successor file, the game is played in a memory-mapped table, resuming it if the
+    file already holds a game of the same cups.
+    """
+    if successor_file is None:
+        end_cups = play_crab_cups(cups, moves=moves, num_cups=num_cups)
+    else:
+        game = SuccessorFile.open(successor_file, cups, num_cups)
+        end_cups = game.play(moves)
     star_cup1 = end_cups[1]
     star_cup2 = end_cups[star_cup1]
 
@@ -106,7 +293,7 @@ def main():
     ####################
     #      Part 2      #
     ####################
-    star_cup_prod = get_product_star_cups(cups)
+    star_cup_prod = get_product_star_cups(cups, successor_file=args.successor_file)
     print("[Part 2]\nProduct of Star Cups: {}".format(star_cup_prod))
     
 
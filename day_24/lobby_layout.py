@@ -1,5 +1,4 @@
-from collections import defaultdict
-import copy
+from collections import Counter
 import numpy as np
 import argparse
 
@@ -12,21 +11,6 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def _normalize_inputs(inputs):
-    instructions = []
-
-    for idx, line in enumerate(inputs):
-        instructions.append([])
-        direction = ""
-        for char in line:
-            direction += char
-            if char[-1] in 'ew':
-                instructions[idx].append(direction)
-                direction = ""
-
-    return instructions
-
-
 def get_inputs(input_file):
     """Return a list of inputs delimited by newlines"""
     inputs = []
@@ -34,105 +18,160 @@ def get_inputs(input_file):
     with open(input_file, 'r') as infile:
         inputs = [line.strip() for line in infile]
 
-    inputs = _normalize_inputs(inputs)
-
     return inputs
 
 
-# directions are [e, ne, nw, w, sw, se]
-DIRECTIONS = np.array([[1, -1, 0], [1, 0, -1], [0, 1, -1], [-1, 1, 0], [-1, 0, 1], [0, -1, 1]])
-
-
-def flip_tiles(instructions):
-    """Flip the tiles according to instructions"""
-    tiles = defaultdict(bool)
-
-    for instruction in instructions:
-        coord = np.array([0, 0, 0])
-
-        for move in instruction:
-            if move == 'e':
-                coord = np.add(coord, DIRECTIONS[0])
-            elif move == 'ne':
-                coord = np.add(coord, DIRECTIONS[1])
-            elif move == 'nw':
-                coord = np.add(coord, DIRECTIONS[2])
-            elif move == 'w':
-                coord = np.add(coord, DIRECTIONS[3])
-            elif move == 'sw':
-                coord = np.add(coord, DIRECTIONS[4])
-            elif move == 'se':
-                coord = np.add(coord, DIRECTIONS[5])
-        
-        coord_str = " ".join(str(x) for x in coord)
-        tiles[coord_str] = not tiles[coord_str]
-        
-    return tiles
+# Axial (q, r) steps of each direction
+DIRECTIONS = {'e': (1, 0), 'ne': (1, -1), 'nw': (0, -1), 'w': (-1, 0), 'sw': (-1, 1), 'se': (0, 1)}
 
+# Tiles are keyed by one int packing q into the high 32 bits and r into the low 32 bits,
+# each offset to stay positive, so a neighbor is a single addition away
+KEY_OFFSET = 1 << 31
+
+
+def pack_tile(q, r):
+    """Returns the int key of the tile at axial coordinates (q, r)"""
+    return ((q + KEY_OFFSET) << 32) | (r + KEY_OFFSET)
+
+
+def unpack_tile(key):
+    """Returns the axial coordinates (q, r) of a tile key"""
+    return (key >> 32) - KEY_OFFSET, (key & 0xFFFFFFFF) - KEY_OFFSET
 
-def get_adj_tiles(tile):
-    """Return a list of adjacent tiles"""
-    coord = np.fromstring(tile, dtype=int, sep=' ')
-    adj_tiles = []
-    
-    for direction in DIRECTIONS:
-        adj_tiles.append(" ".join(str(coord[i] + direction[i]) for i in range(3)))
 
-    return adj_tiles
+NEIGHBOR_DELTAS = [(dq << 32) + dr for dq, dr in DIRECTIONS.values()]
 
 
-def tile_art(tiles, days=100):
-    """Execute art exhibit for specified days"""
+# Direction codes from a token's last char being 'w' (3 if so) plus its first char
+# being 'n' (1) or 's' (2), so DIRECTION_VECTORS[code] is that token's step
+DIRECTION_VECTORS = np.array([DIRECTIONS[move] for move in ('e', 'ne', 'se', 'w', 'nw', 'sw')], dtype=np.int64)
 
-    def sort_adjs(adj_tiles):
-        black_adjs = []
-        white_adjs = []
-        
-        for adj_tile in adj_tiles:
-            if adj_tile in tiles and tiles[adj_tile]:
-                black_adjs.append(adj_tile)
-            else:
-                white_adjs.append(adj_tile)
-        return black_adjs, white_adjs
 
-    def check_white_adjs(adj_tiles):
-        to_flip = []
-        for adj_tile in adj_tiles:
-            white_adjs = get_adj_tiles(adj_tile)
-            black_adjs, _ = sort_adjs(white_adjs)
-            if len(black_adjs) == 2:
-                to_flip.append(adj_tile)
+def tokenize_paths(paths):
+    """Returns the line index and direction code of every step in paths, in one pass
 
-        return to_flip
+    Every 'e' or 'w' ends a step, and the char before it says whether it is a diagonal.
+    """
+    chars = np.frombuffer(('\n' + '\n'.join(paths) + '\n').encode(), dtype=np.uint8)
+    ends = np.flatnonzero((chars == ord('e')) | (chars == ord('w')))
+    prefixes = chars[ends - 1]
+    codes = 3 * (chars[ends] == ord('w')) + (prefixes == ord('n')) + 2 * (prefixes == ord('s'))
+    line_ids = np.cumsum(chars == ord('\n'))[ends] - 1
+
+    return line_ids, codes
+
+
+def flip_tiles(paths):
+    """Flip the tiles according to paths, returning the set of black tile keys
+
+    Each path's end is its count of every direction times the direction vectors, and a
+    tile ends up black when an odd number of paths end on it.
+    """
+    line_ids, codes = tokenize_paths(paths)
+    direction_counts = np.bincount(line_ids * 6 + codes, minlength=6 * len(paths)).reshape(-1, 6)
+    q, r = (direction_counts @ DIRECTION_VECTORS).T
+    keys = ((q + KEY_OFFSET).astype(np.uint64) << np.uint64(32)) | (r + KEY_OFFSET).astype(np.uint64)
+    keys, flips = np.unique(keys, return_counts=True)
+
+    return set(keys[flips % 2 == 1].tolist())
+
+
+def get_adj_tiles(tile):
+    """Return a list of adjacent tiles"""
+    return [tile + delta for delta in NEIGHBOR_DELTAS]
+
+
+# The set backend wins while black tiles are few and scattered, the dense one once they fill their bounds
+DENSE_MIN_TILES = 2000
+DENSE_MIN_DENSITY = 0.1
+
+
+class HexGrid:
+    """Black tiles as a dense uint8 array, indexed [r - r_origin, q - q_origin]
+
+    Iterating, len and membership behave like the set of black tile keys, so a grid can
+    stand in for the set anywhere.
+    """
+    def __init__(self, tiles, margin=16):
+        coords = np.array([unpack_tile(tile) for tile in tiles], dtype=np.int64).reshape(-1, 2)
+        q_min, r_min = coords.min(axis=0) if len(coords) else (0, 0)
+        q_max, r_max = coords.max(axis=0) if len(coords) else (0, 0)
+        self.q_origin = int(q_min) - margin
+        self.r_origin = int(r_min) - margin
+        self.cells = np.zeros((r_max - r_min + 1 + 2 * margin, q_max - q_min + 1 + 2 * margin), dtype=np.uint8)
+        self.cells[coords[:, 1] - self.r_origin, coords[:, 0] - self.q_origin] = 1
+
+    def _ensure_margin(self):
+        """Re-pads the grid once a black tile gets within two cells of its edge"""
+        cells = self.cells
+        if cells[:2].any() or cells[-2:].any() or cells[:, :2].any() or cells[:, -2:].any():
+            pad = max(cells.shape) // 2
+            self.cells = np.pad(cells, pad)
+            self.q_origin -= pad
+            self.r_origin -= pad
+
+    def step(self):
+        """Runs one day of the exhibit with six shifted-slice adds"""
+        self._ensure_margin()
+        cells = self.cells
+        rows, cols = cells.shape
+        black_adjs = np.zeros_like(cells)
+        # The outer ring has no black tiles near it, so its counts can stay 0
+        inner = black_adjs[1:-1, 1:-1]
+        for dq, dr in DIRECTIONS.values():
+            inner += cells[1+dr:rows-1+dr, 1+dq:cols-1+dq]
+        self.cells = ((black_adjs == 2) | ((cells == 1) & (black_adjs == 1))).view(np.uint8)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.cells))
+
+    def __iter__(self):
+        for r, q in np.argwhere(self.cells):
+            yield pack_tile(int(q) + self.q_origin, int(r) + self.r_origin)
+
+    def __contains__(self, tile):
+        q, r = unpack_tile(tile)
+        row, col = r - self.r_origin, q - self.q_origin
+        return 0 <= row < self.cells.shape[0] and 0 <= col < self.cells.shape[1] and bool(self.cells[row, col])
+
+
+def _is_dense(tiles):
+    """Returns whether black tiles fill enough of their bounding box for the dense backend"""
+    if len(tiles) < DENSE_MIN_TILES:
+        return False
+    q_span = (max(tiles) >> 32) - (min(tiles) >> 32) + 1
+    r_values = [tile & 0xFFFFFFFF for tile in tiles]
+    r_span = max(r_values) - min(r_values) + 1
+
+    return len(tiles) >= DENSE_MIN_DENSITY * q_span * r_span
+
+
+def tile_art(tiles, days=100, backend='auto'):
+    """Execute art exhibit for specified days
+
+    The set backend is one pass over the black tiles per day, adding one to every
+    neighbor's count, since only tiles next to a black tile can be black the next day.
+    The dense backend steps a HexGrid instead. 'auto' starts on the set backend and
+    moves to the dense one once the black tiles are many and packed closely enough.
+    """
+    if backend == 'dense' and not isinstance(tiles, HexGrid):
+        tiles = HexGrid(tiles)
 
     for _ in range(days):
-        tile_copy = copy.copy(tiles)
-        
-        for tile in tiles:
-            if tiles[tile]:
-                adj_tiles = get_adj_tiles(tile)
-                black_adjs, white_adjs = sort_adjs(adj_tiles)
-                num_black_adjs = len(black_adjs)
-                if not num_black_adjs or num_black_adjs > 2:
-                    tile_copy[tile] = False
-                # TODO: Slow runtime caused by checking all adjacents every iteration.
-                #       Possibly save each tile's neighbor state before every iteration.
-                to_flip = check_white_adjs(white_adjs)
-                for flip_white in to_flip:
-                    tile_copy[flip_white] = True
-        tiles = tile_copy
-        
+        if backend == 'auto' and not isinstance(tiles, HexGrid) and _is_dense(tiles):
+            tiles = HexGrid(tiles)
+        if isinstance(tiles, HexGrid):
+            tiles.step()
+            continue
+        black_adjs = Counter(tile + delta for tile in tiles for delta in NEIGHBOR_DELTAS)
+        tiles = {tile for tile, count in black_adjs.items() if count == 2 or (count == 1 and tile in tiles)}
+
     return tiles
 
 
 def count_black_tiles(tiles):
     """Returns the number of black tiles"""
-    flipped_tiles = 0
-
-    for tile in tiles:
-        flipped_tiles = flipped_tiles + 1 if tiles[tile] else flipped_tiles
-
-    return flipped_tiles
+    return len(tiles)
 
 
 def main():
@@ -1,3 +1,5 @@
+from array import array
+from collections import deque
 import argparse
 
 def parse_arguments():
@@ -29,55 +31,149 @@ def get_inputs(input_file):
     return inputs
 
 
-def execute_instruction(line_count, instruction):
-    """Returns the next instruction line number and value to increment accumulator"""
-    next_instruction = line_count
-    accumulator = 0
-
-    if instruction[0] == 'acc':
-        accumulator += instruction[1]
-        next_instruction += 1
-    elif instruction[0] == 'jmp':
-        next_instruction += instruction[1]
-    elif instruction[0] == 'nop':
-        next_instruction += 1
-
-    return next_instruction, accumulator
-
-
-def get_accum_after_halt(instructions):
+ACC, JMP, NOP = range(3)
+OPCODES = {'acc': ACC, 'jmp': JMP, 'nop': NOP}
+
+
+def compile_program(instructions):
+    """Compiles instructions into parallel opcode and argument arrays"""
+    opcodes = array('b', (OPCODES[operation] for operation, _ in instructions))
+    arguments = array('q', (argument for _, argument in instructions))
+
+    return opcodes, arguments
+
+
+class Machine:
+    """A reusable handheld console running a compiled program
+
+    After run, status is 'halted' if the program ran off its end, 'loop' if an instruction
+    was about to run a second time and 'budget' if the step budget ran out.
+    """
+    def __init__(self, instructions):
+        self.opcodes, self.arguments = compile_program(instructions)
+        self.visited = bytearray(len(self.opcodes))
+        self._blank = bytes(len(self.opcodes))
+        self.reset()
+
+    def reset(self):
+        """Clears the accumulator, pointer and visited bitmap in place"""
+        self.accumulator = 0
+        self.pointer = 0
+        self.last_instruction = 0
+        self.status = None
+        self.visited[:] = self._blank
+
+    def run(self, step_budget=None, flip=None):
+        """Runs until the program halts, loops or uses up step_budget steps
+
+        flip is the index of a jmp or nop to run as the other operation, without changing
+        the program. Returns the accumulator.
+        """
+        opcodes, arguments, visited = self.opcodes, self.arguments, self.visited
+        end = len(opcodes)
+        accumulator, pointer, last_instruction = self.accumulator, self.pointer, self.last_instruction
+        steps = 0
+        self.status = 'halted'
+
+        while 0 <= pointer < end:
+            if visited[pointer]:
+                self.status = 'loop'
+                break
+            if step_budget is not None and steps >= step_budget:
+                self.status = 'budget'
+                break
+            visited[pointer] = 1
+            last_instruction = pointer
+            steps += 1
+
+            opcode = opcodes[pointer]
+            if pointer == flip and opcode != ACC:
+                opcode = NOP if opcode == JMP else JMP
+            if opcode == ACC:
+                accumulator += arguments[pointer]
+                pointer += 1
+            elif opcode == JMP:
+                pointer += arguments[pointer]
+            else:
+                pointer += 1
+
+        self.accumulator, self.pointer, self.last_instruction = accumulator, pointer, last_instruction
+
+        return accumulator
+
+
+def get_accum_after_halt(instructions, machine=None):
     """Execute each instruction until we see that instruction as already executed"""
-    visited_instructions = []
+    if machine is None:
+        machine = Machine(instructions)
+    machine.reset()
+    accumulator = machine.run()
+
+    if machine.status == 'halted' and machine.pointer == len(instructions):
+        return accumulator, machine.pointer
+    return accumulator, machine.last_instruction
+
+
+def _flipped_target(opcode, argument, index):
+    """Returns where an instruction goes next when its jmp or nop is swapped"""
+    return index + 1 if opcode == JMP else index + argument
+
+
+def find_repairs(instructions):
+    """Returns (index, accumulator) for every single jmp/nop flip that makes the program terminate
+
+        Algorithm: Build the control flow graph once and walk it backwards from the end to
+                   find every instruction that already runs to termination, along with the
+                   accumulator it adds on the way there. A looping program only ever reaches
+                   its own path, and none of it can terminate, so the only useful flips are
+                   on that path and send it into the terminating set.
+    """
+    opcodes, arguments = compile_program(instructions)
+    end = len(opcodes)
+
+    predecessors = [[] for _ in range(end + 1)]
+    for index in range(end):
+        target = index + arguments[index] if opcodes[index] == JMP else index + 1
+        if 0 <= target <= end:
+            predecessors[target].append(index)
+
+    # Accumulator gained from each instruction until termination, None if it never terminates
+    accum_to_end = [None] * (end + 1)
+    accum_to_end[end] = 0
+    queue = deque([end])
+    while queue:
+        target = queue.popleft()
+        for index in predecessors[target]:
+            gain = arguments[index] if opcodes[index] == ACC else 0
+            accum_to_end[index] = accum_to_end[target] + gain
+            queue.append(index)
+
+    if accum_to_end[0] is not None:
+        return []
+
+    repairs = []
+    visited = bytearray(end)
     accumulator = 0
-    next_instruction = 0
-
-    while next_instruction not in visited_instructions:
-        visited_instructions.append(next_instruction)
-        next_instruction, accum = execute_instruction(next_instruction, instructions[next_instruction])
-        accumulator += accum
-        if next_instruction == len(instructions) and visited_instructions[-1] == len(instructions) - 1:
-            return accumulator, next_instruction
+    index = 0
+    while 0 <= index < end and not visited[index]:
+        visited[index] = 1
+        opcode, argument = opcodes[index], arguments[index]
+        if opcode != ACC:
+            target = _flipped_target(opcode, argument, index)
+            if 0 <= target <= end and accum_to_end[target] is not None:
+                repairs.append((index, accumulator + accum_to_end[target]))
+        if opcode == ACC:
+            accumulator += argument
+        index += argument if opcode == JMP else 1
 
-    return accumulator, visited_instructions[-1]
+    return repairs
 
 
 def fix_program(instructions):
-    """Iterate through potential fixes until the last line was executed"""
-    accumulator = 0
-    fix_attempt_count = 0
-    last_instruction = 0
-
-    while last_instruction != len(instructions):
-        new_instruction = instructions[fix_attempt_count]
-        old_instruction = new_instruction.copy()
-        if new_instruction[0] != 'acc':
-            new_instruction[0] = 'jmp' if new_instruction[0] == 'nop' else 'nop'
-            instructions[fix_attempt_count] = new_instruction
-            accumulator, last_instruction = get_accum_after_halt(instructions)
-            instructions[fix_attempt_count] = old_instruction
-        fix_attempt_count += 1
-
-    return accumulator
+    """Returns the accumulator after the first repair that lets the program terminate"""
+    repairs = find_repairs(instructions)
+
+    return repairs[0][1] if repairs else None
 
 
 def main():
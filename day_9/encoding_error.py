@@ -1,9 +1,13 @@
+from collections import Counter, deque
 import argparse
+import numpy as np
 
 def parse_arguments():
     """Parses command line arguments"""
     parser = argparse.ArgumentParser(description='Loading inputs from a text file.')
     parser.add_argument('--input_file', '-i', help='Path to text input file.', default='input.txt')
+    parser.add_argument('--preamble', '-p', help='Number of previous numbers to check against.',
+                        type=int, default=25)
 
     return parser.parse_args()
 
@@ -28,39 +32,105 @@ def get_inputs(input_file):
     return inputs
 
 
-def check_encoding_rule(inputs, index):
-    """Returns True if the number at index is the sum of 2 of the previous 25 numbers"""
-    for i in range(1, 26):
-        diff = inputs[index] - inputs[index - i]
-        if diff in inputs[index-25:index]:
-            return True
-
-    return False
-
-
-def find_bad_number(inputs):
-    """Tests each input after the preamble if it passes the encoding rule"""
-    for index in range(25, len(inputs)):
-        result = check_encoding_rule(inputs, index)
-        if not result:
-            return index, inputs[index]
-
-
-def find_encryption_weakness(inputs, fault_index):
+def read_numbers(input_file):
+    """Lazily yields the numbers of an input file, one per line"""
+    with open(input_file, 'r') as infile:
+        for line in infile:
+            if line.strip():
+                yield int(line)
+
+
+def find_invalid_numbers(numbers, preamble=25):
+    """Yields (index, number) for every number that is not the sum of two different previous numbers
+
+    The previous preamble numbers are kept as a window with a multiset of its values,
+    which updates in O(1) as the window slides, so numbers can come from any stream.
+    """
+    window = deque()
+    window_counts = Counter()
+
+    for index, number in enumerate(numbers):
+        if len(window) == preamble:
+            if not any(number - value != value and number - value in window_counts for value in window_counts):
+                yield index, number
+            oldest = window.popleft()
+            window_counts[oldest] -= 1
+            if not window_counts[oldest]:
+                del window_counts[oldest]
+        window.append(number)
+        window_counts[number] += 1
+
+
+def find_bad_number(inputs, preamble=25):
+    """Returns the index and value of the first number breaking the encoding rule"""
+    return next(find_invalid_numbers(inputs, preamble), None)
+
+
+def find_weakness_in_stream(numbers, target, min_length=2):
+    """Returns the sum of min/max numbers of the first contiguous range adding up to target
+
+    The numbers are positive, so the range is a window that only ever slides forward:
+    grow it on the right, and shrink it on the left while it sums past the target. The
+    window min/max come from monotonic deques, so every number is touched a constant
+    number of times and numbers can come from any stream.
+    """
+    window = deque()
+    window_sum = 0
+    minimums = deque()
+    maximums = deque()
+
+    for index, number in enumerate(numbers):
+        window.append(number)
+        window_sum += number
+        while minimums and minimums[-1][1] >= number:
+            minimums.pop()
+        minimums.append((index, number))
+        while maximums and maximums[-1][1] <= number:
+            maximums.pop()
+        maximums.append((index, number))
+
+        while window_sum > target:
+            window_sum -= window.popleft()
+        first_index = index - len(window) + 1
+        while minimums and minimums[0][0] < first_index:
+            minimums.popleft()
+        while maximums and maximums[0][0] < first_index:
+            maximums.popleft()
+
+        if window_sum == target and len(window) >= min_length:
+            return minimums[0][1] + maximums[0][1]
+
+    return None
+
+
+def find_encryption_weakness(inputs, fault_index, min_length=2):
     """Returns the sum of min/max numbers of the contiguous range sum of the fault number"""
-    weakness_numbers = []
-
-    for index in range(len(inputs)):
-        if index == fault_index:
-            weakness_numbers = []
+    return find_weakness_in_stream(inputs, inputs[fault_index], min_length)
+
+
+def find_weaknesses(inputs, targets, min_length=2):
+    """Returns the encryption weakness for each of many targets, None where there is no range
+
+    One cumulative sum serves every target. The sums are strictly increasing, so each
+    range end finds its matching start with a binary search, all ends at once.
+    """
+    series = np.asarray(inputs, dtype=np.int64)
+    prefix = np.concatenate(([0], np.cumsum(series)))
+    ends = np.arange(1, len(prefix))
+    weaknesses = []
+
+    for target in targets:
+        starts = np.searchsorted(prefix, prefix[1:] - target)
+        found = (starts < len(prefix)) & (ends - starts >= min_length)
+        found[found] = prefix[starts[found]] == prefix[1:][found] - target
+        if not found.any():
+            weaknesses.append(None)
             continue
-        weakness_numbers.append(inputs[index])
-
-        while sum(weakness_numbers) > inputs[fault_index]:
-            weakness_numbers.pop(0)
+        end = int(np.argmax(found))
+        weakness_range = series[starts[end]:end + 1]
+        weaknesses.append(int(weakness_range.min() + weakness_range.max()))
 
-        if sum(weakness_numbers) == inputs[fault_index] and len(weakness_numbers) > 2:
-            return min(weakness_numbers) + max(weakness_numbers)
+    return weaknesses
 
 
 def main():
@@ -72,7 +142,7 @@ def main():
     ####################
     #      Part 1      #
     ####################
-    fault_index, bad_number = find_bad_number(inputs)
+    fault_index, bad_number = find_bad_number(inputs, args.preamble)
     print("[Part 1]\nBad Number: {}\n".format(bad_number))
     
     ####################